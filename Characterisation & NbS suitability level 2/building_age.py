@@ -1,18 +1,31 @@
 import os
-import geopandas as gpd
+import shutil
+import sys
 import ee
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import rioxarray
-import numpy as np
-from urllib.request import urlretrieve
+
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from ee_downloads import download_all
+from ee_tiles import tiled_jobs, mosaic_tiles
+from raster_cache import RasterCache, geometry_digest
+from regions import load_regions
+from ghs_obat_local import local_gpkg_path, footprints_to_raster
+
+# 'ee' reduces the footprints to an image on Earth Engine and downloads it;
+# 'local' reads the GHS-OBAT GeoPackages in ghs_obat_gpkg_dir (only the footprints
+# of each region, via the GPKG spatial index) and rasterizes them here, offline
+backend = 'ee'
+ghs_obat_gpkg_dir = os.path.join('..', 'data', 'GHS_OBAT')
 
 # Initialize Earth Engine
-try:
-    ee.Initialize(project='XXXXXXXXXXXXX')  # Replace with your GEE project ID
-except Exception:
-    ee.Authenticate()
-    ee.Initialize(project='XXXXXXXXXXXXX')
+if backend == 'ee':
+    try:
+        ee.Initialize(project='XXXXXXXXXXXXX')  # Replace with your GEE project ID
+    except Exception:
+        ee.Authenticate()
+        ee.Initialize(project='XXXXXXXXXXXXX')
 
 # GHS-OBAT assets per country
 ghs_obat_iso_assets = {
@@ -26,21 +39,21 @@ ghs_obat_iso_assets = {
 }
 
 #  List of regions to loop through
-regions_info = [
-    {'region': 'Split_Dalmatia', 'country': 'Croatia', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Croatia\Split_Dalmatia.shp'},
-    {'region': 'Macedonia_Thrace', 'country': 'Greece', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Greece\Macedonia_Thrace.shp'},
-    {'region': 'Potenza', 'country': 'Italy', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Italy\Potenza.shp'},
-    {'region': 'Corse_du_Sud', 'country': 'France', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\France\Corse_du_Sud.shp'},
-    {'region': 'Sardegna', 'country': 'Italy', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Italy\Sardegna.shp'},
-    {'region': 'Beiras_Centro', 'country': 'Portugal', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Portugal\Beiras_Centro.shp'},
-    {'region': 'Nicosia', 'country': 'Cyprus', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Cyprus\Nicosia.shp'},
-    {'region': 'Valencia', 'country': 'Spain', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Spain\Valencia.shp'}
-]
+regions = load_regions()
 
 # Create output folder
 output_dir = "ghs_epoch_rasters"
 os.makedirs(output_dir, exist_ok=True)
 
+# 'tiled' splits each region bbox into tiles that stay under the Earth Engine
+# direct-download size limit and mosaics them (VRT -> COG); 'single' requests the
+# whole bbox at once, which fails for large regions (e.g. Sardegna) at 30 m
+export_mode = 'tiled'
+export_scale = 30
+
+# Raster cache (../data/raster_cache)
+raster_cache = RasterCache(max_bytes=20e9)
+
 def gdf_to_ee(gdf):
     return ee.Geometry(gdf.geometry.union_all().__geo_interface__)
 
@@ -56,48 +69,104 @@ cmap = plt.matplotlib.colors.ListedColormap([epoch_colors[i] for i in epoch_colo
 bounds = list(epoch_colors.keys()) + [6]
 norm = plt.matplotlib.colors.BoundaryNorm(bounds, cmap.N)
 
-#  Loop through all regions
-for item in regions_info:
+#  1. Build the epoch image of every region and queue its export
+jobs, region_gdfs, region_tiles, region_params = [], {}, {}, {}
+for item in regions:
     region = item['region']
     country = item['country']
-    shapefile_path = item['shapefile']
-
-    print(f" Processing {region} in {country}...")
 
     try:
-        try:
-            gdf = gpd.read_file(shapefile_path)
-        except UnicodeDecodeError:
-            gdf = gpd.read_file(shapefile_path, encoding='ISO-8859-1')  # Fallback if UTF-8 fails
+        gdf = regions.gdf(region)
+        asset_path = ghs_obat_iso_assets[country]
+        region_geom = regions.geometry(region)
+
+        cache_params = dict(asset=asset_path, band='epoch', reducer='first', scale=export_scale,
+                            crs='EPSG:4326' if export_mode == 'tiled' else None,
+                            region=geometry_digest(region_geom))
+        if backend == 'local':
+            cache_params.update(crs='EPSG:4326', backend='local')
+            if raster_cache.get(cache_params) is None:
+                tmp_path = os.path.join(output_dir, f"{region}_epoch.tmp.tif")
+                _, n_buildings = footprints_to_raster(
+                    local_gpkg_path(asset_path, ghs_obat_gpkg_dir), region_geom, 'epoch',
+                    export_scale, tmp_path, where="epoch IS NOT NULL",
+                    dtype='uint8', nodata=0)
+                if n_buildings == 0:
+                    os.remove(tmp_path)
+                    print(f" No epoch data for {region}")
+                    continue
+                raster_cache.add(cache_params, src_path=tmp_path)
+                print(f" {region}: {n_buildings} footprints rasterized locally")
+            region_params[region] = cache_params
+            region_gdfs[region] = gdf
+            continue
 
         ee_geom = gdf_to_ee(gdf)
         bbox = ee_geom.bounds()
 
         # Get FeatureCollection and reduce to image
-        asset_path = ghs_obat_iso_assets[country]
         fc = ee.FeatureCollection(asset_path).filterBounds(ee_geom).filter(ee.Filter.neq('epoch', None))
         image = fc.reduceToImage(['epoch'], ee.Reducer.first()).clip(bbox)
 
-        # Download GeoTIFF
-        filename = f"{region}_epoch.tif".replace(" ", "_")
-        tif_path = os.path.join(output_dir, filename)
-
-        if not os.path.exists(tif_path):
-            url = image.getDownloadURL({
-                'scale': 30,
-                'region': bbox,
-                'format': 'GEO_TIFF'
-            })
-            urlretrieve(url, tif_path)
+        region_params[region] = cache_params
+        if raster_cache.get(cache_params) is None:
+            if export_mode == 'tiled':
+                # One tile folder per cache key, so tiles of other settings are never mosaicked
+                tile_dir = os.path.join(output_dir, 'tiles', raster_cache.key(cache_params))
+                region_tiles[region] = tiled_jobs(image, region_geom.bounds,
+                                                  export_scale, f"{region}_epoch".replace(" ", "_"),
+                                                  tile_dir)
+                jobs.extend(region_tiles[region])
+            else:
+                jobs.append(dict(
+                    name=region, path=raster_cache.path(cache_params),
+                    # resolved inside the download worker: getDownloadURL blocks too
+                    url=lambda image=image, bbox=bbox: image.getDownloadURL({
+                        'scale': export_scale,
+                        'region': bbox,
+                        'format': 'GEO_TIFF'
+                    })))
+        region_gdfs[region] = gdf
+    except Exception as e:
+        print(f" Error preparing {region}: {e}")
+
+#  2. Download the GeoTIFFs / tiles
+download_stats = download_all(jobs, max_workers=4)
+download_stats.to_csv(os.path.join(output_dir, "download_stats.csv"), index=False)
+
+#  3. Mosaic the tiles of each region into one COG and cache it
+status = download_stats.set_index('name')['status']
+region_paths = {}
+for region, cache_params in region_params.items():
+    tif_path = raster_cache.path(cache_params)
+    tiles = region_tiles.get(region)
+    if tiles:
+        failed = (status.loc[[t['name'] for t in tiles]] == 'failed').sum()
+        if failed:
+            print(f" {region}: {failed} tile(s) failed, skipping mosaic")
+            continue
+        mosaic_tiles([t['path'] for t in tiles], tif_path)
+        shutil.rmtree(os.path.dirname(tiles[0]['path']), ignore_errors=True)
+        raster_cache.add(cache_params)
+    elif region in status.index:
+        if status[region] == 'failed':
+            continue
+        raster_cache.add(cache_params)
+    region_paths[region] = tif_path
+print("Raster cache:", raster_cache.stats())
+
+#  4. Plot every region that downloaded
+for region, tif_path in region_paths.items():
+    gdf = region_gdfs[region]
+
+    print(f" Plotting {region}...")
 
+    try:
         # Load raster and reproject
         da = rioxarray.open_rasterio(tif_path, masked=True).squeeze().astype("float32")
         da = da.rio.reproject("EPSG:4326")
         masked_da = da.where(da > 0)
 
-        # Reproject shapefile
-        gdf = gdf.to_crs("EPSG:4326")
-
         # Plot
         fig, ax = plt.subplots(figsize=(8, 8), facecolor='white')
         masked_da.plot.imshow(ax=ax, cmap=cmap, norm=norm, add_colorbar=False)
@@ -1,22 +1,38 @@
 import os
-import geopandas as gpd
+import sys
 import ee
 import matplotlib.pyplot as plt
 import rioxarray
-from urllib.request import urlretrieve
 import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from ee_downloads import download_all
+from raster_cache import RasterCache, geometry_digest
+from regions import load_regions
+from ghs_obat_local import local_gpkg_path, footprints_to_raster
+from building_stats import region_footprints, footprint_statistics
+
+# 'ee' reduces the footprints on Earth Engine and downloads the image; 'local'
+# rasterizes the footprints of each region from the GHS-OBAT GeoPackages, offline
+backend = 'ee'
+ghs_obat_gpkg_dir = os.path.join('..', 'data', 'GHS_OBAT')
 
 # Initialize Earth Engine
-try:
-    ee.Initialize(project='XXXXXXXXX')
-except Exception:
-    ee.Authenticate()
-    ee.Initialize(project='XXXXXXXXX')
+if backend == 'ee':
+    try:
+        ee.Initialize(project='XXXXXXXXX')
+    except Exception:
+        ee.Authenticate()
+        ee.Initialize(project='XXXXXXXXX')
 
 # Folders and configuration
-base_folder = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations"
 raster_dir = "ghs_height_rasters"
 os.makedirs(raster_dir, exist_ok=True)
+height_scale = 500
+
+# Raster cache (../data/raster_cache)
+raster_cache = RasterCache(max_bytes=20e9)
 
 ghs_obat_iso_assets = {
     'Italy':     'projects/sat-io/open-datasets/JRC/GHS-OBAT/GHS_OBAT_GPKG_ITA_E2020_R2024A_V1_0',
@@ -28,21 +44,16 @@ ghs_obat_iso_assets = {
     'Greece':    'projects/sat-io/open-datasets/JRC/GHS-OBAT/GHS_OBAT_GPKG_GRC_E2020_R2024A_V1_0'
 }
 
-# Load shapefiles
-shapefiles = []
-for root, dirs, files in os.walk(base_folder):
-    for file in files:
-        if file.endswith('.shp'):
-            full_path = os.path.join(root, file)
-            region = os.path.splitext(file)[0]
-            country = os.path.basename(os.path.dirname(full_path))
-            shapefiles.append((country, region, full_path))
+# Load regions
+regions = load_regions()
 
 def gdf_to_ee(gdf):
     return ee.Geometry(gdf.geometry.union_all().__geo_interface__)
 
-# Loop through all regions
-for country, region, path in shapefiles:
+# 1. Build the height image of every region and queue its export
+jobs, region_gdfs, region_params = [], {}, {}
+for item in regions:
+    country, region = item['country'], item['region']
     asset_path = ghs_obat_iso_assets.get(country)
 
     if not asset_path:
@@ -50,9 +61,32 @@ for country, region, path in shapefiles:
         continue
 
     try:
-        gdf = gpd.read_file(path, encoding='ISO-8859-1', engine='fiona')
-        if gdf.empty:
-            raise ValueError("Empty shapefile")
+        gdf = regions.gdf(region)
+        region_geom = regions.geometry(region)
+        cache_params = dict(asset=asset_path, band='height', reducer='first', filter='height>0',
+                            scale=height_scale, region=geometry_digest(region_geom))
+
+        if backend == 'local':
+            cache_params.update(crs='EPSG:4326', backend='local')
+        if raster_cache.get(cache_params) is not None:
+            region_params[region] = cache_params
+            region_gdfs[region] = gdf
+            continue
+
+        if backend == 'local':
+            # Rasterize next to the outputs and move into the cache only if there is data
+            tmp_path = os.path.join(raster_dir, f"{region}_height.tmp.tif")
+            _, count = footprints_to_raster(
+                local_gpkg_path(asset_path, ghs_obat_gpkg_dir), region_geom, 'height',
+                height_scale, tmp_path, where="height > 0")
+            if count == 0:
+                os.remove(tmp_path)
+                print(f" No height data for {region}")
+                continue
+            raster_cache.add(cache_params, src_path=tmp_path)
+            region_params[region] = cache_params
+            region_gdfs[region] = gdf
+            continue
 
         ee_geom = gdf_to_ee(gdf)
         ee_geom_bbox = ee_geom.bounds()
@@ -68,19 +102,37 @@ for country, region, path in shapefiles:
             print(f" No height data for {region}")
             continue
 
-        # Download height image
         image = fc.reduceToImage(['height'], ee.Reducer.first()).clip(ee_geom_bbox)
-        filename = f"{region}_height.tif".replace(" ", "_")
-        tif_path = os.path.join(raster_dir, filename)
-
-        if not os.path.exists(tif_path):
-            url = image.getDownloadURL({
-                'scale': 500,
-                'region': ee_geom_bbox,
+        region_params[region] = cache_params
+        jobs.append(dict(
+            name=region, path=raster_cache.path(cache_params),
+            url=lambda image=image, bbox=ee_geom_bbox: image.getDownloadURL({
+                'scale': height_scale,
+                'region': bbox,
                 'format': 'GEO_TIFF'
-            })
-            urlretrieve(url, tif_path)
+            })))
+        region_gdfs[region] = gdf
 
+    except Exception as e:
+        print(f" Error for {region}: {e}")
+
+# 2. Download the height images
+download_stats = download_all(jobs, max_workers=4)
+download_stats.to_csv(os.path.join(raster_dir, "download_stats.csv"), index=False)
+
+for _, job in download_stats[download_stats['status'] != 'failed'].iterrows():
+    raster_cache.add(region_params[job['name']])
+failed = set(download_stats.loc[download_stats['status'] == 'failed', 'name'])
+print("Raster cache:", raster_cache.stats())
+
+# 3. Mask and plot every region that downloaded
+for region, cache_params in region_params.items():
+    if region in failed:
+        continue
+    tif_path = raster_cache.path(cache_params)
+    gdf = region_gdfs[region]
+
+    try:
         # Open and mask raster
         da = rioxarray.open_rasterio(tif_path).squeeze()
         da.rio.write_crs("EPSG:4326", inplace=True)
@@ -119,3 +171,17 @@ for country, region, path in shapefiles:
 
     except Exception as e:
         print(f" Error for {region}: {e}")
+
+# 4. Footprint statistics per region (needs the local GeoPackages)
+compute_statistics = backend == 'local'
+if compute_statistics:
+    region_frame = regions.frame(names=list(region_gdfs))
+    gpkg_paths = {c: local_gpkg_path(ghs_obat_iso_assets[c], ghs_obat_gpkg_dir)
+                  for c in region_frame['country'].unique()}
+    codes, epoch, height, area = region_footprints(region_frame, gpkg_paths)
+    building_stats = footprint_statistics(codes, list(region_frame['region']), epoch, height, area)
+    stats_path = os.path.join(raster_dir, "ghs_obat_region_statistics.csv")
+    building_stats.to_csv(stats_path, index=False)
+    print(pd.pivot_table(building_stats[building_stats['class'] == 'total'],
+                         index='region', columns='indicator', values='value').round(1))
+    print(f" Saved: {stats_path}")
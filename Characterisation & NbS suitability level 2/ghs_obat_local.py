@@ -0,0 +1,161 @@
+"""
+Local backend for the GHS-OBAT building footprints (GeoPackages on disk instead of Earth Engine).
+
+Replaces `ee.FeatureCollection(asset).filterBounds(region).reduceToImage([attr], first())`
+plus `getDownloadURL`: only the footprints whose bounding box intersects the
+region are read, through the GeoPackage R-tree (bbox pushdown) and as Arrow
+record batches, and the attribute is burned into an EPSG:4326 GeoTIFF at the
+requested scale. The footprints of the region are held in memory (geometries
+and the requested columns only); the raster is not: it is written in row
+strips rasterized in a thread pool (each strip only gets the footprints an
+STRtree finds for it), with at most two strips per worker in flight, so its
+memory use is set by `strip_rows` and the number of workers.
+
+The GeoPackages are expected as `<gpkg_dir>/<asset name>.gpkg`, e.g.
+`GHS_OBAT_GPKG_ITA_E2020_R2024A_V1_0.gpkg`.
+
+Example
+-------
+    from ghs_obat_local import local_gpkg_path, footprints_to_raster
+
+    gpkg = local_gpkg_path(ghs_obat_iso_assets['Italy'], 'data/GHS_OBAT')
+    footprints_to_raster(gpkg, gdf.geometry.union_all(), 'epoch', scale=30,
+                         out_path='Sardegna_epoch.tif', where="epoch IS NOT NULL")
+"""
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pyogrio
+import rasterio
+import shapely
+from pyogrio.raw import open_arrow
+from pyproj import CRS, Transformer
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+METERS_PER_DEGREE = 111320.0
+
+
+def local_gpkg_path(asset_path, gpkg_dir):
+    """Local GeoPackage of an Earth Engine GHS-OBAT asset id."""
+    return os.path.join(gpkg_dir, os.path.basename(asset_path) + '.gpkg')
+
+
+def _to_layer_crs(geom, layer_crs):
+    """`geom` (EPSG:4326) in the CRS of the GeoPackage layer."""
+    if layer_crs is None or CRS.from_user_input(layer_crs) == CRS.from_epsg(4326):
+        return geom
+    transformer = Transformer.from_crs("EPSG:4326", layer_crs, always_xy=True)
+    return shapely.transform(geom, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
+def read_footprints(gpkg_path, region, columns, layer=None, where=None, batch_size=65536,
+                    crs="EPSG:4326"):
+    """
+    Footprints intersecting `region` (shapely geometry, EPSG:4326) and their attribute columns.
+
+    The region bbox is pushed down to the GeoPackage R-tree and `where` (an OGR SQL
+    filter, e.g. "height > 0") to the driver; batches are then filtered exactly
+    against the region. Returns (geometries in `crs`, {column: values}).
+    """
+    layer_crs = pyogrio.read_info(gpkg_path, layer=layer)['crs']
+    region_layer = _to_layer_crs(region, layer_crs)
+    shapely.prepare(region_layer)
+
+    geoms, values = [], {c: [] for c in columns}
+    with open_arrow(gpkg_path, layer=layer, bbox=tuple(region_layer.bounds), columns=list(columns),
+                    where=where, batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        geom_col = meta['geometry_name'] or 'wkb_geometry'
+        for batch in reader:
+            batch_geoms = shapely.from_wkb(batch.column(geom_col).to_numpy(zero_copy_only=False))
+            keep = shapely.intersects(region_layer, batch_geoms)
+            if not keep.any():
+                continue
+            geoms.append(batch_geoms[keep])
+            for c in columns:
+                values[c].append(batch.column(c).to_numpy(zero_copy_only=False)[keep])
+
+    geoms = np.concatenate(geoms) if geoms else np.empty(0, dtype=object)
+    values = {c: (np.concatenate(v) if v else np.empty(0)) for c, v in values.items()}
+    if len(geoms) and layer_crs is not None and CRS.from_user_input(layer_crs) != CRS.from_user_input(crs):
+        transformer = Transformer.from_crs(layer_crs, crs, always_xy=True)
+        geoms = shapely.transform(geoms, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+    return geoms, values
+
+
+def raster_grid(bounds, scale):
+    """EPSG:4326 transform and (height, width) of a `scale`-metre grid over `bounds`."""
+    minx, miny, maxx, maxy = bounds
+    dy = scale / METERS_PER_DEGREE
+    dx = dy / max(math.cos(math.radians((miny + maxy) / 2)), 0.01)
+    width = max(1, math.ceil((maxx - minx) / dx))
+    height = max(1, math.ceil((maxy - miny) / dy))
+    return from_origin(minx, maxy, dx, dy), (height, width)
+
+
+def rasterize_to_file(geoms, values, bounds, scale, out_path, dtype='float32', nodata=np.nan,
+                      strip_rows=1024, n_workers=None):
+    """
+    Burn `values` of `geoms` (EPSG:4326) into a tiled GeoTIFF, keeping the first feature per pixel.
+
+    Like reduceToImage(first()), a pixel takes the value of the first footprint
+    (in input order) that contains its centre. Strips of `strip_rows` rows are
+    rasterized in parallel, at most 2 x `n_workers` at a time, and written as
+    they complete.
+    """
+    transform, (height, width) = raster_grid(bounds, scale)
+    tree = shapely.STRtree(geoms)
+    values = np.asarray(values)
+
+    def burn(row0):
+        rows = min(strip_rows, height - row0)
+        strip_transform = transform * transform.translation(0, row0)
+        left, top = strip_transform * (0, 0)
+        right, bottom = strip_transform * (width, rows)
+        idx = np.sort(tree.query(shapely.box(left, bottom, right, top)))
+        # rasterize() keeps the last shape drawn on a pixel: draw in reverse for 'first'
+        idx = idx[::-1]
+        if idx.size == 0:
+            strip = np.full((rows, width), nodata, dtype=dtype)
+        else:
+            strip = rasterize(zip(geoms[idx], values[idx]), out_shape=(rows, width),
+                              transform=strip_transform, fill=nodata, dtype=dtype)
+        return row0, strip
+
+    profile = dict(driver='GTiff', width=width, height=height, count=1, dtype=dtype,
+                   crs='EPSG:4326', transform=transform, nodata=nodata, tiled=True,
+                   blockxsize=256, blockysize=256, compress='DEFLATE', BIGTIFF='IF_SAFER')
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    n_workers = n_workers or os.cpu_count()
+
+    def write(futures):
+        for future in futures:
+            row0, strip = future.result()
+            dst.write(strip, 1, window=Window(0, row0, width, strip.shape[0]))
+
+    with rasterio.open(out_path, 'w', **profile) as dst, \
+            ThreadPoolExecutor(max_workers=n_workers) as pool:
+        pending = set()
+        for row0 in range(0, height, strip_rows):
+            if len(pending) >= 2 * n_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write(done)
+            pending.add(pool.submit(burn, row0))
+        write(wait(pending).done)
+    return out_path
+
+
+def footprints_to_raster(gpkg_path, region, attribute, scale, out_path, where=None, layer=None,
+                         dtype='float32', nodata=np.nan, n_workers=None):
+    """
+    Local equivalent of the GHS-OBAT Earth Engine export of `attribute` over the bbox of `region`.
+
+    Returns (out_path, number of footprints burned).
+    """
+    geoms, values = read_footprints(gpkg_path, region, [attribute], layer=layer, where=where)
+    rasterize_to_file(geoms, values[attribute].astype(dtype), region.bounds, scale, out_path,
+                      dtype=dtype, nodata=nodata, n_workers=n_workers)
+    return out_path, len(geoms)
@@ -39,41 +39,35 @@ download(data_url + gpw_pop_2020)
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
-import rioxarray as rxr
 import os
-import xrspatial
+from matplotlib.colors import ListedColormap
+
+from population_raster import population_change_classes, read_preview, CHANGE_COLORS, CHANGE_LABELS
 
 # File paths
 data_folder = r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\data'
 pop2010_path = os.path.join(data_folder, 'gpw-v4-population-count-rev11_2010_2pt5_min_tif', 'gpw_v4_population_count_rev11_2010_2pt5_min.tif')
 pop2020_path = os.path.join(data_folder, 'gpw-v4-population-count-rev11_2020_2pt5_min_tif', 'gpw_v4_population_count_rev11_2020_2pt5_min.tif')
 
-# Load rasters
-pop2010 = rxr.open_rasterio(pop2010_path, mask_and_scale=True).squeeze()
-pop2020 = rxr.open_rasterio(pop2020_path, mask_and_scale=True).squeeze()
-change = pop2020 - pop2010
-
-# Clip to Mediterranean bounding box using rio.clip_box
-change_med = change.rio.clip_box(minx=-10, maxx=35, miny=30, maxy=50)
-
-# Reclassify the clipped data
-class_bins = [-100, 100, 1000, np.inf]
-class_values = [1, 2, 3, 4]
-change_class = xrspatial.classify.reclassify(change_med, bins=class_bins, new_values=class_values)
+# Windowed, block-streamed change and reclassification: only the Mediterranean
+# window is read and the uint8 classes go straight into a tiled GeoTIFF
+# (same code for the 100 m GHS-POP rasters)
+med_bbox = (-10, 30, 35, 50)  # minx, miny, maxx, maxy
+change_class_path = os.path.join('output', 'population_change_class_MED_2010_2020.tif')
+class_counts = population_change_classes(pop2010_path, pop2020_path, change_class_path, bbox=med_bbox)
+print(class_counts)
 
 # Define colors and labels
-colors = ['#3288bd', '#e0e0e0', '#fdae61', '#d7191c']
-labels = ['Decline', 'Neutral', 'Growth', 'High Growth']
+colors = list(CHANGE_COLORS)
+labels = list(CHANGE_LABELS)
+change_class, extent = read_preview(change_class_path)
+change_class = np.ma.masked_equal(change_class, 0)
 
 # Plot
 fig, ax = plt.subplots(figsize=(10, 6))
 
-change_class.plot.imshow(
-    ax=ax,
-    add_colorbar=False,
-    levels=[1, 2, 3, 4, 5],
-    colors=colors
-)
+ax.imshow(change_class, extent=extent, cmap=ListedColormap(colors), vmin=0.5, vmax=4.5,
+          interpolation='nearest')
 
 patches = [mpatches.Patch(color=colors[i], label=labels[i]) for i in range(4)]
 ax.legend(handles=patches, loc='lower center', ncol=4, bbox_to_anchor=(0.5, -0.1))
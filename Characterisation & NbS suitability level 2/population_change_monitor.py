@@ -1,20 +1,34 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.stats import linregress
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from regions import load_regions
+from population_trends import trend_table
+from population_raster import population_trend_raster
+from zonal_population import case_study_regions, ghs_pop_epochs, zonal_population_table
 
 # === Load the cleaned long-format population dataset ===
+# regenerate_table = True recomputes it from the GHS-POP epoch rasters for the
+# Demo Boundaries regions (label grid cached in ../data/raster_cache)
+regenerate_table = False
 file_path = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\CLEAN_ZonalPop_ByRegion_1975_2030.csv"
-df = pd.read_csv(file_path)
+ghs_pop_folder = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\data\GHS_POP"
 
-# === Compute growth trend (slope) for each region ===
-trend_data = []
-for region in df['Region'].unique():
-    region_df = df[df['Region'] == region]
-    slope, intercept, r_value, p_value, std_err = linregress(region_df['Year'], region_df['Population'])
-    trend_data.append({'Region': region, 'Slope': slope})
+if regenerate_table:
+    df = zonal_population_table(ghs_pop_epochs(ghs_pop_folder), case_study_regions(load_regions()))
+    df.to_csv('CLEAN_ZonalPop_ByRegion_1975_2030.csv', index=False)
+else:
+    df = pd.read_csv(file_path)
 
-trend_df = pd.DataFrame(trend_data)
+# === Compute growth trend (slope) for each region, all regions in one pass ===
+# 'ols' (linregress) or 'theil_sen' (robust); breakpoints adds a two-segment fit per region
+trend_method = 'ols'
+trend_df = trend_table(df, method=trend_method, breakpoints=True)
+print(trend_df.round(3))
 
 # === Define category thresholds ===
 q1 = trend_df['Slope'].quantile(0.25)
@@ -47,4 +61,16 @@ plt.legend(title="Growth Category", bbox_to_anchor=(1.05, -0.15), loc='upper rig
 
 plt.tight_layout()
 plt.grid(False, axis='y')  #remove y-grid lines for clarity
-plt.show()
\ No newline at end of file
+plt.show()
+
+# === Raster mode: per-pixel trend and growth class over all GHS-POP epochs ===
+# Shows where inside each region population is shifting; the epochs are read
+# block by block over the Mediterranean window only.
+pixel_trends = False
+
+if pixel_trends:
+    os.makedirs('output', exist_ok=True)
+    population_trend_raster(ghs_pop_epochs(ghs_pop_folder),
+                            os.path.join('output', 'population_trend_MED_1975_2030.tif'),
+                            class_path=os.path.join('output', 'population_trend_class_MED_1975_2030.tif'),
+                            bbox=(-10, 30, 35, 50))
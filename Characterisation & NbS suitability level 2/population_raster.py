@@ -0,0 +1,247 @@
+"""
+Windowed, block-streamed population change between two population rasters (GPW, GHS-POP).
+
+Only the window covering the requested bbox (or the union of the region
+geometries) is read, in blocks of `block_size` x `block_size` pixels. Each
+block is turned into the change (end - start) and the four change classes and
+written straight into a tiled, compressed GeoTIFF (uint8 classes, optionally
+float32 change), so memory use is set by the block size and not by the
+raster size; the global GPW grid and the 100 m GHS-POP grid go through the
+same code.
+
+Classes follow xrspatial.classify.reclassify with CHANGE_BINS as upper bounds:
+1 Decline (<= -100), 2 Neutral (-100, 100], 3 Growth (100, 1000],
+4 High Growth (> 1000); 0 is nodata.
+
+`population_trend_raster` stacks any number of epochs (e.g. GHS-POP
+1975-2030) the same way and writes the per-pixel OLS slope (persons/year,
+float32) and the growth class of population_change_monitor.classify_growth
+(1 Decline: slope < 0, 2 Neutral: <= q25, 3 Growth: <= q75, 4 High Growth),
+with the quartiles taken over the populated pixels.
+
+Bboxes are given in EPSG:4326 and transformed to the raster CRS.
+
+Example
+-------
+    from population_raster import population_change_classes, population_trend_raster, read_preview
+
+    population_change_classes(pop2010_path, pop2020_path, 'output/pop_change_class_MED.tif',
+                              bbox=(-10, 30, 35, 50))
+    classes, extent = read_preview('output/pop_change_class_MED.tif')
+
+    population_trend_raster({1975: path_1975, ..., 2030: path_2030}, 'output/pop_trend_MED.tif',
+                            'output/pop_trend_class_MED.tif', bbox=(-10, 30, 35, 50))
+"""
+import os
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+CHANGE_BINS = (-100, 100, 1000, np.inf)
+CHANGE_CLASSES = (1, 2, 3, 4)
+CHANGE_LABELS = ('Decline', 'Neutral', 'Growth', 'High Growth')
+CHANGE_COLORS = ('#3288bd', '#e0e0e0', '#fdae61', '#d7191c')
+
+
+def bbox_window(src, bbox, bbox_crs="EPSG:4326"):
+    """Pixel window of `src` covering `bbox` (minx, miny, maxx, maxy in `bbox_crs`), clipped to the raster."""
+    if bbox is None:
+        return Window(0, 0, src.width, src.height)
+    if bbox_crs is not None and src.crs is not None and src.crs != CRS.from_user_input(bbox_crs):
+        bbox = transform_bounds(bbox_crs, src.crs, *bbox, densify_pts=21)
+    window = from_bounds(*bbox, transform=src.transform)
+    col0, row0 = np.floor(window.col_off + 1e-6), np.floor(window.row_off + 1e-6)
+    col1 = np.ceil(window.col_off + window.width - 1e-6)
+    row1 = np.ceil(window.row_off + window.height - 1e-6)
+    col0, row0 = max(int(col0), 0), max(int(row0), 0)
+    col1, row1 = min(int(col1), src.width), min(int(row1), src.height)
+    return Window(col0, row0, max(col1 - col0, 0), max(row1 - row0, 0))
+
+
+def reclassify_change(change, bins=CHANGE_BINS, values=CHANGE_CLASSES, nodata=0):
+    """uint8 classes of `change` (bins are inclusive upper bounds, NaN -> `nodata`)."""
+    lookup = np.asarray(list(values) + [nodata], dtype='uint8')
+    idx = np.searchsorted(np.asarray(bins, dtype='float64'), change, side='left')
+    idx[np.isnan(change)] = len(values)
+    return lookup[np.minimum(idx, len(values))]
+
+
+def read_population(src, window):
+    """float64 block of band 1 with nodata (and non-finite values) as NaN, scale/offset applied."""
+    block = src.read(1, window=window, masked=True).astype('float64')
+    block = block * src.scales[0] + src.offsets[0]
+    block = block.filled(np.nan)
+    block[~np.isfinite(block)] = np.nan
+    return block
+
+
+def block_windows(window, block_size):
+    """Sub-windows of `window` in row-major blocks of `block_size` pixels."""
+    for row in range(0, int(window.height), block_size):
+        for col in range(0, int(window.width), block_size):
+            yield Window(col, row, min(block_size, window.width - col), min(block_size, window.height - row))
+
+
+def _area_of_interest(src, bbox, regions):
+    """Window for `bbox` (EPSG:4326) or the bounds of `regions`, and the region geometries in the raster CRS."""
+    region_geoms = None
+    if regions is not None:
+        regions = regions.to_crs(src.crs)
+        region_geoms = list(regions.geometry)
+    if bbox is None and region_geoms is not None:
+        window = bbox_window(src, regions.total_bounds, bbox_crs=None)
+    else:
+        window = bbox_window(src, bbox)
+    if window.width < 1 or window.height < 1:
+        raise ValueError(f"bbox {bbox} does not overlap {src.name}")
+    return window, region_geoms
+
+
+def _check_same_grid(datasets):
+    first = datasets[0]
+    for other in datasets[1:]:
+        if other.crs != first.crs or other.transform != first.transform or other.shape != first.shape:
+            raise ValueError(f"{first.name} and {other.name} are not on the same grid")
+
+
+def _profile(src, window):
+    return dict(driver='GTiff', width=int(window.width), height=int(window.height), count=1,
+                crs=src.crs, transform=src.window_transform(window), tiled=True, blockxsize=256,
+                blockysize=256, compress='DEFLATE', BIGTIFF='IF_SAFER')
+
+
+def _source_block(window, block):
+    return Window(window.col_off + block.col_off, window.row_off + block.row_off, block.width, block.height)
+
+
+def population_change_classes(start_path, end_path, out_path, bbox=None, regions=None,
+                              bins=CHANGE_BINS, values=CHANGE_CLASSES, change_path=None,
+                              block_size=1024):
+    """
+    Classified population change (end - start) over `bbox` or `regions`, written block by block.
+
+    `bbox` is in EPSG:4326; `regions` (GeoDataFrame) limits the window to their
+    total bounds and masks pixels outside them. Both rasters must share grid and
+    CRS. Writes a uint8 GeoTIFF to `out_path` (and the float32 change to
+    `change_path` if given); returns the pixel count per class.
+    """
+    with rasterio.open(start_path) as start, rasterio.open(end_path) as end:
+        _check_same_grid([start, end])
+        window, region_geoms = _area_of_interest(start, bbox, regions)
+        profile = _profile(start, window)
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        dst_change = None
+        if change_path is not None:
+            dst_change = rasterio.open(change_path, 'w', dtype='float32', nodata=np.nan, **profile)
+        counts = np.zeros(len(values) + 1, dtype='int64')
+        try:
+            with rasterio.open(out_path, 'w', dtype='uint8', nodata=0, **profile) as dst:
+                for block in block_windows(window, block_size):
+                    src_block = _source_block(window, block)
+                    change = read_population(end, src_block) - read_population(start, src_block)
+                    if region_geoms is not None:
+                        outside = geometry_mask(region_geoms, out_shape=change.shape,
+                                                transform=start.window_transform(src_block))
+                        change[outside] = np.nan
+                    classes = reclassify_change(change, bins, values)
+                    counts += np.bincount(classes.ravel(), minlength=len(values) + 1)[:len(values) + 1]
+                    dst.write(classes, 1, window=block)
+                    if dst_change is not None:
+                        dst_change.write(change.astype('float32'), 1, window=block)
+        finally:
+            if dst_change is not None:
+                dst_change.close()
+    print(f" Population change classes written: {out_path} ({profile['width']} x {profile['height']} px)")
+    return dict(zip(values, counts[1:].tolist()))
+
+
+def pixel_slope(stack, years):
+    """
+    OLS slope along axis 0 of `stack` (epochs x rows x cols) against `years`, ignoring NaNs.
+
+    Pixels with fewer than two valid epochs get NaN.
+    """
+    x = (np.asarray(years, dtype='float64') - np.mean(years))[:, None, None]
+    valid = ~np.isnan(stack)
+    y = np.where(valid, stack, 0.0)
+    n = valid.sum(axis=0)
+    sx = (valid * x).sum(axis=0)
+    sy = y.sum(axis=0)
+    sxx = (valid * x * x).sum(axis=0)
+    sxy = (x * y).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+    slope[n < 2] = np.nan
+    return slope
+
+
+def classify_slope(slope, q1, q3, nodata=0):
+    """uint8 growth classes of classify_growth(): 1 Decline, 2 Neutral, 3 Growth, 4 High Growth."""
+    classes = np.select([slope < 0, slope <= q1, slope <= q3], [1, 2, 3], default=4).astype('uint8')
+    classes[np.isnan(slope)] = nodata
+    return classes
+
+
+def population_trend_raster(epoch_paths, out_path, class_path=None, bbox=None, regions=None,
+                            block_size=512, sample_size=2000):
+    """
+    Per-pixel population trend over the epochs in `epoch_paths` ({year: raster path}).
+
+    Pass 1 reads all epochs block by block and writes the OLS slope (float32,
+    NaN where the pixel is unpopulated in every epoch or outside `regions`).
+    If `class_path` is given, the quartiles of the slope are estimated from a
+    decimated read (at most `sample_size` pixels per side) and pass 2 writes the
+    growth classes (uint8, 0 nodata). Returns the (q1, q3) used, or None.
+    """
+    years = sorted(epoch_paths)
+    sources = [rasterio.open(epoch_paths[year]) for year in years]
+    try:
+        _check_same_grid(sources)
+        window, region_geoms = _area_of_interest(sources[0], bbox, regions)
+        profile = _profile(sources[0], window)
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        with rasterio.open(out_path, 'w', dtype='float32', nodata=np.nan, **profile) as dst:
+            for block in block_windows(window, block_size):
+                src_block = _source_block(window, block)
+                stack = np.stack([read_population(src, src_block) for src in sources])
+                slope = pixel_slope(stack, years)
+                slope[~(np.nan_to_num(stack) > 0).any(axis=0)] = np.nan
+                if region_geoms is not None:
+                    outside = geometry_mask(region_geoms, out_shape=slope.shape,
+                                            transform=sources[0].window_transform(src_block))
+                    slope[outside] = np.nan
+                dst.write(slope.astype('float32'), 1, window=block)
+    finally:
+        for src in sources:
+            src.close()
+    print(f" Population trend written: {out_path} ({profile['width']} x {profile['height']} px, "
+          f"{years[0]}-{years[-1]}, {len(years)} epochs)")
+    if class_path is None:
+        return None
+
+    sample, _ = read_preview(out_path, max_size=sample_size)
+    sample = sample[np.isfinite(sample)]
+    if sample.size == 0:
+        raise ValueError(f"No populated pixels in {out_path}")
+    q1, q3 = np.quantile(sample, [0.25, 0.75])
+    with rasterio.open(out_path) as src, \
+            rasterio.open(class_path, 'w', dtype='uint8', nodata=0, **profile) as dst:
+        for block in block_windows(Window(0, 0, src.width, src.height), block_size):
+            dst.write(classify_slope(src.read(1, window=block), q1, q3), 1, window=block)
+    print(f" Growth classes written: {class_path} (q25 = {q1:.3g}, q75 = {q3:.3g} persons/year)")
+    return q1, q3
+
+
+def read_preview(path, max_size=2000):
+    """Band 1 decimated (nearest) to at most `max_size` pixels per side, and its plot extent."""
+    with rasterio.open(path) as src:
+        factor = max(1, int(np.ceil(max(src.width, src.height) / max_size)))
+        shape = (int(np.ceil(src.height / factor)), int(np.ceil(src.width / factor)))
+        data = src.read(1, out_shape=shape, resampling=Resampling.nearest)
+        left, bottom, right, top = src.bounds
+    return data, (left, right, bottom, top)
@@ -2,10 +2,25 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import math
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from regions import load_regions
+from zonal_population import case_study_regions, ghs_pop_epochs, zonal_population_table
 
 # === Load the cleaned long-format population dataset ===
+# regenerate_table = True recomputes it from the GHS-POP epoch rasters for the
+# Demo Boundaries regions (label grid cached in ../data/raster_cache)
+regenerate_table = False
 file_path = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\CLEAN_ZonalPop_ByRegion_1975_2030.csv"
-df = pd.read_csv(file_path)
+ghs_pop_folder = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\data\GHS_POP"
+
+if regenerate_table:
+    df = zonal_population_table(ghs_pop_epochs(ghs_pop_folder), case_study_regions(load_regions()))
+    df.to_csv('CLEAN_ZonalPop_ByRegion_1975_2030.csv', index=False)
+else:
+    df = pd.read_csv(file_path)
 
 # === Set seaborn style ===
 sns.set(style="whitegrid")
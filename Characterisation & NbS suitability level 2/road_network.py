@@ -0,0 +1,190 @@
+"""
+GRIP4 road network per case-study region.
+
+The road file is read once, limited to the bbox of the union of all regions
+(row-group pushdown for the GeoParquet copy, see common/geoparquet_layers, or
+pyogrio's bbox filter for the shapefile), and every road is matched against an
+STRtree of the region geometries with a single vectorized shapely 2 query, so
+the cost grows with the number of roads read rather than roads x regions.
+
+Roads crossing a border are clipped to the region before their length is
+measured, and road density grids (km of road per km² per cell, one band per
+GP_RTP type plus the total) are computed by cutting all line segments at the
+grid cell boundaries at once, in array form, and summing the piece lengths per
+cell with a bincount.
+
+Example
+-------
+    from road_network import roads_by_region, clip_to_region, density_grid, write_density_grid
+
+    region_roads = roads_by_region(roads_path, regions.frame())   # one row per (road, region)
+    for region_name, roads_gdf in region_roads.groupby('region'):
+        region_geom = regions.geometry(region_name, crs="EPSG:3035")
+        roads_gdf = clip_to_region(roads_gdf.to_crs("EPSG:3035"), region_geom)
+        grid, transform = density_grid(roads_gdf.geometry.values, roads_gdf['GP_RTP'].values,
+                                       region_geom, cell_size=1000, classes=[1, 2, 3, 4, 5, 0])
+        write_density_grid('density.tif', grid, transform, "EPSG:3035", band_names)
+"""
+import math
+import os
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import shapely
+from rasterio.features import geometry_mask
+from rasterio.transform import from_origin
+
+from geoparquet_layers import layer_crs, read_layer
+
+ROAD_COLUMNS = ('GP_RTP', 'GP_RAV')
+
+
+def read_roads(roads_path, bbox=None, columns=ROAD_COLUMNS):
+    """Roads whose bbox intersects `bbox` (in the road file's CRS), as a GeoDataFrame."""
+    return read_layer(roads_path, bbox, columns)
+
+
+def assign_to_regions(geoms, region_geoms):
+    """(geometry index, region index) pairs of every intersecting geometry/region combination."""
+    tree = shapely.STRtree(region_geoms)
+    geom_idx, region_idx = tree.query(geoms, predicate='intersects')
+    order = np.lexsort((region_idx, geom_idx))
+    return geom_idx[order], region_idx[order]
+
+
+def roads_by_region(roads_path, regions, columns=ROAD_COLUMNS, name_col='region'):
+    """
+    All roads intersecting any of `regions` (GeoDataFrame), one row per (road, region) pair.
+
+    The roads are returned in the road file's CRS with `name_col` added and
+    `road_id` identifying the source row (a road crossing a border appears once
+    per region it touches).
+    """
+    roads_crs = layer_crs(roads_path)
+    regions_match = regions.to_crs(roads_crs)
+    bbox = regions_match.geometry.union_all().bounds
+    roads = read_roads(roads_path, bbox, columns)
+
+    road_idx, region_idx = assign_to_regions(roads.geometry.values, regions_match.geometry.values)
+    joined = roads.iloc[road_idx].reset_index(names='road_id')
+    joined[name_col] = regions[name_col].values[region_idx]
+    return gpd.GeoDataFrame(joined, geometry='geometry', crs=roads.crs)
+
+
+def clip_to_region(roads, region_geom):
+    """
+    `roads` (GeoDataFrame) cut to `region_geom` (same CRS); roads left empty are dropped.
+
+    Only roads that are not entirely inside the region go through the (vectorized)
+    intersection; the others are kept as they are.
+    """
+    region = shapely.from_wkb(shapely.to_wkb(region_geom))
+    shapely.prepare(region)
+    geoms = roads.geometry.values
+    inside = shapely.contains_properly(region, geoms)
+    clipped = np.array(geoms, dtype=object)
+    clipped[~inside] = shapely.intersection(np.asarray(geoms[~inside]), region)
+    roads = roads.set_geometry(gpd.GeoSeries(clipped, index=roads.index, crs=roads.crs))
+    return roads[shapely.length(clipped) > 0]
+
+
+def grid_pieces(geoms, origin, cell_size):
+    """
+    Cut lines at the cell boundaries of a `cell_size` grid with top-left corner `origin`.
+
+    Every segment is split at its crossings with the grid lines (parameters t in
+    [0, 1] along the segment); each piece lies in exactly one cell, found from its
+    midpoint. Returns (geometry index, row, col, length) arrays, one entry per piece.
+    """
+    parts, part_geom = shapely.get_parts(geoms, return_index=True)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+    same = coord_part[1:] == coord_part[:-1]
+    seg_geom = part_geom[coord_part[:-1][same]]
+
+    left, top = origin
+    gx = (coords[:, 0] - left) / cell_size
+    gy = (top - coords[:, 1]) / cell_size
+    x0, x1 = gx[:-1][same], gx[1:][same]
+    y0, y1 = gy[:-1][same], gy[1:][same]
+    seg_len = np.hypot(x1 - x0, y1 - y0) * cell_size
+    n_seg = len(x0)
+
+    def crossings(a0, a1):
+        n = np.abs(np.floor(a1) - np.floor(a0)).astype('int64')
+        seg = np.repeat(np.arange(n_seg), n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        line = np.floor(np.minimum(a0, a1))[seg] + 1 + k
+        return seg, (line - a0[seg]) / (a1 - a0)[seg]
+
+    seg_x, t_x = crossings(x0, x1)
+    seg_y, t_y = crossings(y0, y1)
+    seg = np.concatenate([np.arange(n_seg), np.arange(n_seg), seg_x, seg_y])
+    t = np.concatenate([np.zeros(n_seg), np.ones(n_seg), t_x, t_y])
+    order = np.lexsort((t, seg))
+    seg, t = seg[order], t[order]
+
+    keep = (seg[:-1] == seg[1:]) & (t[1:] > t[:-1])
+    seg, t0, t1 = seg[:-1][keep], t[:-1][keep], t[1:][keep]
+    mid = (t0 + t1) / 2
+    col = np.floor(x0[seg] + mid * (x1 - x0)[seg]).astype('int64')
+    row = np.floor(y0[seg] + mid * (y1 - y0)[seg]).astype('int64')
+    return seg_geom[seg], row, col, (t1 - t0) * seg_len[seg]
+
+
+def density_grid(geoms, codes, region_geom, cell_size, classes):
+    """
+    Road density in km per km² on a `cell_size` (metres) grid over `region_geom`.
+
+    `geoms` are line geometries in a metric CRS (clipped to the region) and `codes`
+    their class (e.g. GP_RTP). Returns a float32 array of shape
+    (len(classes) + 1, rows, cols) -- one band per class, the last band all roads --
+    and its affine transform. The grid is aligned to multiples of `cell_size`;
+    cells not touching the region are NaN.
+    """
+    minx, miny, maxx, maxy = region_geom.bounds
+    left = math.floor(minx / cell_size) * cell_size
+    top = math.ceil(maxy / cell_size) * cell_size
+    width = max(1, math.ceil((maxx - left) / cell_size))
+    height = max(1, math.ceil((top - miny) / cell_size))
+    transform = from_origin(left, top, cell_size, cell_size)
+
+    n_classes = len(classes)
+    class_order = np.argsort(classes)
+    sorted_classes = np.asarray(classes)[class_order]
+    codes = np.asarray(codes)
+    pos = np.clip(np.searchsorted(sorted_classes, codes), 0, n_classes - 1)
+    class_idx = np.where(sorted_classes[pos] == codes, class_order[pos], -1)
+
+    geom_idx, row, col, length = grid_pieces(np.asarray(geoms), (left, top), cell_size)
+    ok = (row >= 0) & (row < height) & (col >= 0) & (col < width)
+    cell = row[ok] * width + col[ok]
+    cls = class_idx[geom_idx[ok]]
+    km = length[ok] / 1000
+
+    grid = np.zeros((n_classes + 1, height * width))
+    known = cls >= 0
+    grid[:n_classes] = np.bincount(cls[known] * height * width + cell[known], weights=km[known],
+                                   minlength=n_classes * height * width).reshape(n_classes, -1)
+    grid[n_classes] = np.bincount(cell, weights=km, minlength=height * width)
+    grid = (grid / (cell_size / 1000) ** 2).reshape(n_classes + 1, height, width).astype('float32')
+
+    outside = geometry_mask([region_geom], out_shape=(height, width), transform=transform,
+                            all_touched=True)
+    grid[:, outside] = np.nan
+    return grid, transform
+
+
+def write_density_grid(out_path, grid, transform, crs, band_names):
+    """Write a density_grid() result as a tiled, compressed multi-band GeoTIFF with band names."""
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    n_bands, height, width = grid.shape
+    profile = dict(driver='GTiff', width=width, height=height, count=n_bands, dtype='float32',
+                   crs=crs, transform=transform, nodata=np.nan, compress='DEFLATE')
+    if width >= 256 and height >= 256:
+        profile.update(tiled=True, blockxsize=256, blockysize=256)
+    with rasterio.open(out_path, 'w', **profile) as dst:
+        dst.write(grid)
+        for band, name in enumerate(band_names, start=1):
+            dst.set_band_description(band, name)
+    return out_path
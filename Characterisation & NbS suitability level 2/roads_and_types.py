@@ -1,10 +1,14 @@
-import fiona
 import geopandas as gpd
-from shapely.geometry import shape
 import matplotlib.pyplot as plt
-from collections import defaultdict
+import numpy as np
 import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from regions import load_regions
+from geoparquet_layers import ensure_geoparquet
+from road_network import roads_by_region, clip_to_region, density_grid, write_density_grid
 
 # -------------------------------
 # Road type and availability labels
@@ -22,24 +26,16 @@ road_colors = {
 }
 
 # -------------------------------
-# Region info + appropriate projected CRS
+# Regions to process
 # -------------------------------
-regions_info = [
-    {'region': 'Split_Dalmatia', 'country': 'Croatia', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Croatia\Split_Dalmatia.shp'},
-    {'region': 'Macedonia_Thrace', 'country': 'Greece', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Greece\Macedonia_Thrace.shp'},
-    {'region': 'Potenza', 'country': 'Italy', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Italy\Potenza.shp'},
-    {'region': 'Corse_du_Sud', 'country': 'France', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\France\Corse_du_Sud.shp'},
-    {'region': 'Sardegna', 'country': 'Italy', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Italy\Sardegna.shp'},
-    {'region': 'Beiras_Centro', 'country': 'Portugal', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Portugal\Beiras_Centro.shp'},
-    {'region': 'Nicosia', 'country': 'Cyprus', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Cyprus\Nicosia.shp'},
-    {'region': 'Valencia', 'country': 'Spain', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Spain\Valencia.shp'}
-]
+regions = load_regions()
 
 
 # -------------------------------
-# GRIP4 Roads shapefile (local)
+# GRIP4 Roads shapefile (local, read through a GeoParquet copy)
 # -------------------------------
-roads_path = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\Roads\GRIP4_Region4_vector_shp\GRIP4_region4.shp"
+roads_shp_path = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\Roads\GRIP4_Region4_vector_shp\GRIP4_region4.shp"
+roads_path = ensure_geoparquet(roads_shp_path)
 
 # -------------------------------
 # Output directory for maps and plots
@@ -48,76 +44,37 @@ output_dir = "road_outputs"
 os.makedirs(output_dir, exist_ok=True)
 
 # -------------------------------
-# Try encoding helper
+# Road density grid cell size (m, EPSG:3035)
 # -------------------------------
-def safe_read_shapefile(filepath):
-    encodings_to_try = ['utf-8', 'ISO-8859-1', 'latin1']
-    for enc in encodings_to_try:
-        try:
-            return gpd.read_file(filepath, encoding=enc)
-        except UnicodeDecodeError:
-            print(f" Encoding failed: {enc}")
-    raise RuntimeError(" Failed to decode shapefile with known encodings.")
+density_cell_size = 1000
+
+# -------------------------------
+# Assign the roads to all regions in one pass
+# -------------------------------
+region_roads = roads_by_region(roads_path, regions.frame())
+print(f" {region_roads['road_id'].nunique()} road segments intersect the regions")
 
 # -------------------------------
 # Process each region
 # -------------------------------
-for info in regions_info:
+for info in regions:
     region_name = info['region']
-    region_shapefile = info['shapefile']
     print(f"\n Processing region: {region_name}")
 
-    try:
-        # Load region shapefile
-        region_gdf = safe_read_shapefile(region_shapefile)
-
-        # Read road CRS from Fiona
-        with fiona.open(roads_path) as road_src:
-            roads_crs = road_src.crs_wkt  # safer full definition
-            src_crs = road_src.crs  # for fallback
-
-        # Reproject region to match roads CRS for intersection
-        region_gdf_match = region_gdf.to_crs(roads_crs)
-        region_geom_match = region_gdf_match.geometry.union_all()
-
-    except Exception as e:
-        print(f" Failed to load region or reproject: {e}")
-        continue
-
-    # -------------------------------
-    # Select intersecting roads
-    # -------------------------------
-    selected_features = []
-    with fiona.open(roads_path) as src:
-        for feat in src:
-            if feat['geometry'] is None:
-                continue
-            try:
-                geom = shape(feat['geometry'])
-                if geom.is_empty:
-                    continue
-                if geom.intersects(region_geom_match):
-                    selected_features.append({
-                        'geometry': geom,
-                        'properties': feat['properties']
-                    })
-            except Exception:
-                continue
-
-    if not selected_features:
+    roads_gdf = region_roads[region_roads['region'] == region_name]
+    if roads_gdf.empty:
         print(f" No valid roads found in {region_name}")
         continue
 
-    # -------------------------------
-    # Convert to GeoDataFrame
-    # -------------------------------
-    roads_gdf = gpd.GeoDataFrame.from_features(selected_features, crs=src_crs)
-
     # Reproject both region and roads to EPSG:3035 for accurate measurement
     target_crs = "EPSG:3035"
-    region_gdf = region_gdf.to_crs(target_crs)
+    region_gdf = regions.gdf(region_name, crs=target_crs)
     roads_gdf = roads_gdf.to_crs(target_crs)
 
+    # Clip to the region so that cross-border roads only count inside it
+    region_geom = regions.geometry(region_name, crs=target_crs)
+    roads_gdf = clip_to_region(roads_gdf, region_geom)
+
     # -------------------------------
     # Map attributes and compute length
     # -------------------------------
@@ -125,6 +82,17 @@ for info in regions_info:
     roads_gdf["availability"] = roads_gdf["GP_RAV"].map(road_availability_labels)
     roads_gdf["length_km"] = roads_gdf.geometry.length / 1000  # In km
 
+    # -------------------------------
+    # Road density grid (km/km², one band per road type + all roads)
+    # -------------------------------
+    type_codes = list(road_type_labels)
+    density, density_transform = density_grid(roads_gdf.geometry.values, roads_gdf["GP_RTP"].to_numpy(),
+                                              region_geom, density_cell_size, type_codes)
+    density_path = os.path.join(output_dir, f"{region_name}_road_density_{density_cell_size}m.tif")
+    write_density_grid(density_path, density, density_transform, target_crs,
+                       [road_type_labels[c] for c in type_codes] + ["All roads"])
+    print(f" Road density grid saved: {density_path} (max {np.nanmax(density[-1]):.2f} km/km²)")
+
     # -------------------------------
     # Summary statistics
     # -------------------------------
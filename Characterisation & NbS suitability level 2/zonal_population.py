@@ -0,0 +1,165 @@
+"""
+Zonal population per region and epoch, straight from the GHS-POP / GPW rasters.
+
+Regenerates the long Region / Year / Population table
+(CLEAN_ZonalPop_ByRegion_1975_2030.csv) for any set of regions, without the
+Earth Engine export of populations_for_regions.js:
+
+1. the region polygons are rasterized once into a label grid (0 = no region,
+   i = i-th region) aligned to the population grid over the bounds of all
+   regions, written in strips and kept in the raster cache (../data/raster_cache),
+   so later runs and every epoch on the same grid reuse it;
+2. every epoch raster is read once, block by block over that window; blocks
+   without any region are skipped and each remaining block adds
+   `bincount(labels, weights=population)` to the per-region totals.
+
+Pixels are assigned to the region containing their centre (where regions
+overlap, the later one wins), so totals can differ slightly from Earth
+Engine's area-weighted reduceRegions sums along the borders.
+
+Example
+-------
+    from zonal_population import case_study_regions, ghs_pop_epochs, zonal_population_table
+
+    df = zonal_population_table(ghs_pop_epochs(ghs_pop_folder), case_study_regions(load_regions()))
+    df.to_csv('CLEAN_ZonalPop_ByRegion_1975_2030.csv', index=False)
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from rasterio.features import rasterize
+from rasterio.windows import Window
+
+from population_raster import bbox_window, block_windows, read_population
+from raster_cache import RasterCache, geometry_digest
+
+GHS_POP_YEARS = tuple(range(1975, 2031, 5))
+GHS_POP_TEMPLATE = "GHS_POP_E{year}_GLOBE_R2023A_54009_100_V1_0.tif"
+TABLE_COLUMNS = ['Region', 'Year', 'Population', 'shapeGroup', 'shapeName', 'shapeType']
+
+# Demo Boundaries file name -> (Region, shapeGroup, shapeName, shapeType) of the existing table
+# (Corse_du_Sud.shp holds the Provence-Alpes-Côte d'Azur boundary)
+CSV_REGIONS = {
+    'Split_Dalmatia':   ("Croatia – Split-Dalmatia", 'HRV', "Split-Dalmatia", 'ADM1'),
+    'Nicosia':          ("Cyprus – Nicosia", 'CYP', "Nicosia", 'ADM1'),
+    'Corse_du_Sud':     ("France – Provence-Alpes-Côte d'Azur", 'FRA', "Provence-Alpes-Côte d'Azur", 'ADM1'),
+    'Macedonia_Thrace': ("Greece – Macedonia-Thrace", 'GRC', "Macedonia-Thrace", 'ADM1'),
+    'Potenza':          ("Italy – Potenza", 'ITA', "Potenza", 'ADM2'),
+    'Sardegna':         ("Italy – Sardinia", 'ITA', "Sardegna", 'ADM1'),
+    'Beiras_Centro':    ("Portugal – Beiras/Centro", None, None, None),
+    'Valencia':         ("Spain – Valenciana", 'ESP', "Comunitat Valenciana", 'ADM1'),
+}
+
+
+def ghs_pop_epochs(folder, years=GHS_POP_YEARS, template=GHS_POP_TEMPLATE):
+    """{year: path} of the GHS-POP epoch rasters in `folder`."""
+    return {year: os.path.join(folder, template.format(year=year)) for year in years}
+
+
+def case_study_regions(regions, labels=CSV_REGIONS):
+    """
+    Registry regions (common/regions.py) as zonal table input, labelled as in
+    CLEAN_ZonalPop_ByRegion_1975_2030.csv.
+
+    `labels` maps boundary file names to (Region, shapeGroup, shapeName, shapeType);
+    regions missing from it get Region "<Country> – <name>", shapeName the file
+    name and empty shapeGroup / shapeType.
+    """
+    frame = regions.frame()
+    fallback = [(f"{country} – {region.replace('_', '-')}", None, region, None)
+                for country, region in zip(frame['country'], frame['region'])]
+    rows = [labels.get(region, default) for region, default in zip(frame['region'], fallback)]
+    for i, col in enumerate(['Region', 'shapeGroup', 'shapeName', 'shapeType']):
+        frame[col] = [row[i] for row in rows]
+    return frame
+
+
+def label_grid(src, regions, cache=None, block_size=1024):
+    """
+    Path of the region label grid for the grid of `src` (open dataset), and its window in `src`.
+
+    Labels are 1..len(regions) in row order of `regions` (GeoDataFrame), 0 outside.
+    The grid is looked up in / added to `cache` (a RasterCache) keyed by the
+    raster grid and the region geometries.
+    """
+    cache = cache or RasterCache()
+    regions = regions.to_crs(src.crs)
+    geoms = np.asarray(regions.geometry.values)
+    window = bbox_window(src, regions.total_bounds, bbox_crs=None)
+    if window.width < 1 or window.height < 1:
+        raise ValueError(f"The regions do not overlap {src.name}")
+    transform = src.window_transform(window)
+    dtype = 'uint16' if len(geoms) < np.iinfo('uint16').max else 'uint32'
+    params = dict(kind='region_labels', crs=src.crs.to_wkt(), transform=list(transform)[:6],
+                  shape=[int(window.height), int(window.width)], dtype=dtype,
+                  regions=[geometry_digest(g) for g in geoms])
+    path = cache.get(params)
+    if path is not None:
+        return path, window
+
+    path = cache.path(params)
+    tree = shapely.STRtree(geoms)
+    labels = np.arange(1, len(geoms) + 1)
+    profile = dict(driver='GTiff', width=int(window.width), height=int(window.height), count=1,
+                   dtype=dtype, crs=src.crs, transform=transform, nodata=0, tiled=True,
+                   blockxsize=256, blockysize=256, compress='DEFLATE', BIGTIFF='IF_SAFER')
+    with rasterio.open(path, 'w', **profile) as dst:
+        for row0 in range(0, int(window.height), block_size):
+            rows = min(block_size, int(window.height) - row0)
+            strip_transform = transform * transform.translation(0, row0)
+            left, top = strip_transform * (0, 0)
+            right, bottom = strip_transform * (int(window.width), rows)
+            # STRtree order is arbitrary: sort so that overlaps resolve in row order
+            idx = np.sort(tree.query(shapely.box(min(left, right), min(top, bottom),
+                                                 max(left, right), max(top, bottom))))
+            if idx.size == 0:
+                continue
+            strip = rasterize(zip(geoms[idx], labels[idx]), out_shape=(rows, int(window.width)),
+                              transform=strip_transform, fill=0, dtype=dtype)
+            dst.write(strip, 1, window=Window(0, row0, int(window.width), rows))
+    cache.add(params)
+    print(f" Region label grid cached: {path} ({int(window.width)} x {int(window.height)} px)")
+    return path, window
+
+
+def zonal_sums(raster_path, regions, cache=None, block_size=1024):
+    """Sum of `raster_path` over each region (array in row order of `regions`), one pass over the raster."""
+    totals = np.zeros(len(regions) + 1)
+    with rasterio.open(raster_path) as src:
+        label_path, window = label_grid(src, regions, cache, block_size)
+        with rasterio.open(label_path) as labels_src:
+            for block in block_windows(window, block_size):
+                labels = labels_src.read(1, window=block)
+                if not labels.any():
+                    continue
+                src_block = Window(window.col_off + block.col_off, window.row_off + block.row_off,
+                                   block.width, block.height)
+                values = np.nan_to_num(read_population(src, src_block), nan=0.0)
+                totals += np.bincount(labels.ravel(), weights=values.ravel(), minlength=len(totals))
+    return totals[1:]
+
+
+def zonal_population_table(epoch_paths, regions, name_col='Region', cache=None, block_size=1024):
+    """
+    Long table (TABLE_COLUMNS) of the population per region and epoch.
+
+    `epoch_paths` is {year: raster path}; `regions` a GeoDataFrame with the region
+    names in `name_col` and, optionally, shapeGroup / shapeName / shapeType
+    columns (left empty when missing).
+    """
+    cache = cache or RasterCache()
+    frames = []
+    for year, path in sorted(epoch_paths.items()):
+        print(f" Zonal population {year}: {os.path.basename(path)}")
+        frame = pd.DataFrame({'Region': regions[name_col].values, 'Year': year,
+                              'Population': zonal_sums(path, regions, cache, block_size)})
+        for col in TABLE_COLUMNS[3:]:
+            frame[col] = regions[col].values if col in regions else None
+        frames.append(frame)
+    table = pd.concat(frames, ignore_index=True)
+    order = pd.Categorical(table['Region'], categories=pd.unique(regions[name_col]), ordered=True)
+    return table.assign(_order=order).sort_values(['_order', 'Year']).drop(columns='_order') \
+        .reset_index(drop=True)[TABLE_COLUMNS]
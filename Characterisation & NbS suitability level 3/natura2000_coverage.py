@@ -1,52 +1,40 @@
-import pandas as pd
-
-# Prepare list to store area stats
-area_stats = []
-
-# Replace your plotting loop with this (summary only shown)
-for item in regions_info:
-    region = item['region']
-    shapefile_path = item['shapefile']
-
-    print(f" Processing area for {region}...")
-
-    try:
-        region_gdf = gpd.read_file(shapefile_path).to_crs("EPSG:4326")
-    except UnicodeDecodeError:
-        region_gdf = gpd.read_file(shapefile_path, encoding="ISO-8859-1").to_crs("EPSG:4326")
-
-    bbox = tuple(region_gdf.total_bounds)
-
-    with fiona.open(natura_path, 'r') as src:
-        filtered_features = [
-            {**feature, 'geometry': feature['geometry']}
-            for feature in src.filter(bbox=bbox)
-        ]
-
-    if not filtered_features:
-        print(f" No Natura 2000 areas found in {region}")
-        area_stats.append({'Region': region, 'Area_km2': 0})
-        continue
-
-    natura_gdf = gpd.GeoDataFrame.from_features(filtered_features, crs="EPSG:4326")
-    natura_clipped = gpd.clip(natura_gdf, region_gdf)
-
-    # Reproject to a metric CRS for accurate area (e.g., EPSG:3035 – Europe LAEA)
-    natura_clipped = natura_clipped.to_crs("EPSG:3035")
-    natura_clipped['area_km2'] = natura_clipped.geometry.area / 10**6
-
-    total_area = natura_clipped['area_km2'].sum()
-    area_stats.append({'Region': region, 'Area_km2': total_area})
-
-# Create DataFrame
-area_df = pd.DataFrame(area_stats).sort_values(by='Area_km2', ascending=False)
-print(area_df)
-
-# Plot
-plt.figure(figsize=(10, 6))
-plt.barh(area_df['Region'], area_df['Area_km2'], color='green')
-plt.xlabel("Natura 2000 Area (km²)")
-plt.title("Natura 2000 Coverage by Region")
-plt.grid(True, linestyle='--', alpha=0.5)
-plt.tight_layout()
-plt.show()
+import os
+import sys
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from regions import load_regions
+from geoparquet_layers import ensure_geoparquet
+from natura_sites import load_sites, coverage_table
+
+natura_path = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\Nature\natura2000\Natura2000_end2023_epsg4326.shp"
+
+# Overlap-aware coverage: SPA (A) and SCI/SAC (B) sites overlap, so the sites of
+# each region are dissolved per grid tile in a process pool instead of summing
+# the site areas. Everything runs under the __main__ guard, so pool workers
+# (spawned on Windows) only import this module and do no work.
+tile_size = 25000  # m, EPSG:3035
+
+if __name__ == '__main__':
+    natura_parquet = ensure_geoparquet(natura_path)  # one-time conversion to ../data/geoparquet
+    regions = load_regions()
+
+    # Natura 2000 sites of all regions, read once
+    region_frame = regions.frame()
+    sites = load_sites(natura_parquet, region_frame)
+
+    area_df = coverage_table(sites, region_frame, tile_size=tile_size)
+    area_df = area_df.sort_values(by='Area_km2', ascending=False)
+    print(area_df.round(2).to_string(index=False))
+
+    # Plot: dissolved coverage, with the area counted twice by overlapping sites
+    plt.figure(figsize=(10, 6))
+    plt.barh(area_df['Region'], area_df['Area_km2'], color='green', label='Natura 2000 area (dissolved)')
+    plt.barh(area_df['Region'], area_df['Overlap_km2'], left=area_df['Area_km2'], color='lightgreen',
+             label='Overlapping sites (double-counted before)')
+    plt.xlabel("Natura 2000 Area (km²)")
+    plt.title("Natura 2000 Coverage by Region")
+    plt.legend()
+    plt.grid(True, linestyle='--', alpha=0.5)
+    plt.tight_layout()
+    plt.show()
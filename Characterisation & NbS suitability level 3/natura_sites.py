@@ -0,0 +1,180 @@
+"""
+Natura 2000 sites loaded once for all case-study regions and served per region.
+
+The layer is read a single time, limited to the bbox of the union of the
+regions (GeoParquet row-group pushdown, see common/geoparquet_layers), and an
+STRtree is built over the site geometries. One bulk query of all region
+geometries against the tree then gives the sites of every region; sites lying
+entirely inside a region are kept as they are and only the others are cut by
+a vectorized intersection. Loaded layers are memoized per interpreter session
+only (e.g. running both scripts in one IPython kernel); separate runs each do
+their own read, which the GeoParquet copy keeps to the row groups of the bbox.
+
+SPA (SITETYPE A) and SCI/SAC (B) sites overlap heavily, so summing site areas
+double-counts. `coverage_table` dissolves the overlaps instead: the sites of
+each region are cut into grid tiles (EPSG:3035), the pieces of every tile are
+unioned in a process pool, and the tile areas are summed (tiles are disjoint,
+so the sum is the area of the union). It reports the dissolved coverage, the
+dissolved coverage per site type and the overlap area (sum of site areas minus
+dissolved area).
+
+Example
+-------
+    from natura_sites import load_sites, coverage_table
+
+    sites = load_sites(natura_parquet, regions.frame())
+    for region, region_sites in sites.by_region(regions.frame()):
+        region_sites.to_crs("EPSG:3035").area.sum()
+    coverage_df = coverage_table(sites, regions.frame())      # run under `if __name__ == '__main__':`
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from geoparquet_layers import layer_crs, read_layer
+
+_LOADED = {}
+
+
+class SiteLayer:
+    """Natura 2000 sites with an STRtree for bulk per-region queries."""
+
+    def __init__(self, sites):
+        self.sites = sites.reset_index(drop=True)
+        self.geoms = np.asarray(self.sites.geometry.values)
+        self.tree = shapely.STRtree(self.geoms)
+
+    def __len__(self):
+        return len(self.sites)
+
+    def clipped(self, idx, region_geom):
+        """Sites `idx` cut to `region_geom`; sites entirely inside are not intersected."""
+        region = shapely.from_wkb(shapely.to_wkb(region_geom))
+        shapely.prepare(region)
+        geoms = self.geoms[idx]
+        inside = shapely.contains_properly(region, geoms)
+        clipped = geoms.copy()
+        clipped[~inside] = shapely.intersection(geoms[~inside], region)
+        keep = shapely.area(clipped) > 0
+        subset = self.sites.iloc[idx[keep]].copy()
+        return subset.set_geometry(gpd.GeoSeries(clipped[keep], index=subset.index, crs=self.sites.crs))
+
+    def by_region(self, regions, name_col='region'):
+        """Yield (name, clipped sites) for every row of `regions`, from one bulk STRtree query."""
+        regions = regions.to_crs(self.sites.crs)
+        region_idx, site_idx = self.tree.query(np.asarray(regions.geometry.values), predicate='intersects')
+        order = np.lexsort((site_idx, region_idx))
+        region_idx, site_idx = region_idx[order], site_idx[order]
+        bounds = np.searchsorted(region_idx, np.arange(len(regions) + 1))
+        for i, (name, geom) in enumerate(zip(regions[name_col], regions.geometry)):
+            yield name, self.clipped(site_idx[bounds[i]:bounds[i + 1]], geom)
+
+    def region(self, region_geom):
+        """Sites cut to one region geometry (in the layer CRS)."""
+        idx = np.sort(self.tree.query(region_geom, predicate='intersects'))
+        return self.clipped(idx, region_geom)
+
+
+def load_sites(natura_path, regions, columns=None):
+    """
+    SiteLayer of the sites intersecting the union of `regions` (GeoDataFrame), read once.
+
+    Repeated calls with the same file and regions reuse the loaded layer.
+    """
+    regions = regions.to_crs(layer_crs(natura_path))
+    union = shapely.union_all(np.asarray(regions.geometry.values))
+    key = (natura_path, tuple(columns) if columns else None, shapely.to_wkb(shapely.normalize(union)))
+    if key not in _LOADED:
+        sites = read_layer(natura_path, bbox=union.bounds, columns=columns)
+        shapely.prepare(union)
+        keep = shapely.intersects(union, np.asarray(sites.geometry.values))
+        _LOADED[key] = SiteLayer(sites[keep])
+        print(f" Natura 2000 sites loaded for {len(regions)} regions: {len(_LOADED[key])}")
+    return _LOADED[key]
+
+
+def tile_grid(bounds, tile_size):
+    """Boxes of a `tile_size` grid (aligned to multiples of `tile_size`) covering `bounds`."""
+    minx, miny, maxx, maxy = bounds
+    x0, y0 = math.floor(minx / tile_size) * tile_size, math.floor(miny / tile_size) * tile_size
+    xs = np.arange(x0, maxx, tile_size)
+    ys = np.arange(y0, maxy, tile_size)
+    gx, gy = np.meshgrid(xs, ys)
+    return shapely.box(gx.ravel(), gy.ravel(), gx.ravel() + tile_size, gy.ravel() + tile_size)
+
+
+def _tile_areas(batch):
+    """Process-pool worker: (sum of piece areas, dissolved area, {type: dissolved area}) per tile."""
+    out = []
+    for tile_wkb, sites_wkb, types in batch:
+        tile = shapely.from_wkb(tile_wkb)
+        pieces = shapely.intersection(shapely.from_wkb(sites_wkb), tile)
+        piece_area = shapely.area(pieces)
+        dissolved = piece_area[0] if len(pieces) == 1 else shapely.area(shapely.union_all(pieces))
+        by_type = {}
+        for site_type in np.unique(types):
+            of_type = pieces[types == site_type]
+            by_type[site_type] = (piece_area[types == site_type][0] if len(of_type) == 1
+                                  else shapely.area(shapely.union_all(of_type)))
+        out.append((piece_area.sum(), dissolved, by_type))
+    return out
+
+
+def _runs(codes):
+    """(value, start, stop) arrays of the runs of equal values in sorted `codes`."""
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.empty(0, int)
+    stops = np.r_[starts[1:], len(codes)]
+    return codes[starts], starts, stops
+
+
+def coverage_table(layer, regions, name_col='region', type_col='SITETYPE', tile_size=25000,
+                   crs="EPSG:3035", max_workers=None, tiles_per_task=32):
+    """
+    Overlap-aware Natura 2000 coverage per region (km², areas in `crs`).
+
+    Columns: Region, Sites, Area_km2 (dissolved), Sum_km2 (site areas summed),
+    Overlap_km2 (Sum - Area), Coverage_pct of the region area and, if `type_col`
+    exists, <type>_km2 with the dissolved area of each site type. Uses a process
+    pool: call it from under `if __name__ == '__main__':` on Windows.
+    """
+    region_area = dict(zip(regions[name_col], regions.to_crs(crs).area / 1e6))
+    rows, tasks = [], []
+    for name, clipped in layer.by_region(regions, name_col):
+        clipped = clipped.to_crs(crs)
+        geoms = np.asarray(clipped.geometry.values)
+        types = (clipped[type_col].astype(str).to_numpy() if type_col in clipped
+                 else np.full(len(geoms), 'all'))
+        rows.append({'Region': name, 'Sites': len(geoms)})
+        if not len(geoms):
+            continue
+        tiles = tile_grid(shapely.total_bounds(geoms), tile_size)
+        tile_idx, site_idx = shapely.STRtree(geoms).query(tiles, predicate='intersects')
+        order = np.lexsort((site_idx, tile_idx))
+        tile_idx, site_idx = tile_idx[order], site_idx[order]
+        for t, start, stop in zip(*_runs(tile_idx)):
+            idx = site_idx[start:stop]
+            tasks.append((len(rows) - 1, shapely.to_wkb(tiles[t]), shapely.to_wkb(geoms[idx]), types[idx]))
+
+    batches = [tasks[i:i + tiles_per_task] for i in range(0, len(tasks), tiles_per_task)]
+    totals = [{'Sum_km2': 0.0, 'Area_km2': 0.0} for _ in rows]
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        for batch, results in zip(batches, pool.map(_tile_areas, [[t[1:] for t in b] for b in batches])):
+            for (row, *_), (piece_sum, dissolved, by_type) in zip(batch, results):
+                totals[row]['Sum_km2'] += piece_sum / 1e6
+                totals[row]['Area_km2'] += dissolved / 1e6
+                for site_type, area in by_type.items():
+                    key = f"{site_type}_km2"
+                    totals[row][key] = totals[row].get(key, 0.0) + area / 1e6
+
+    table = pd.DataFrame([{**row, **total} for row, total in zip(rows, totals)]).fillna(0.0)
+    table['Overlap_km2'] = table['Sum_km2'] - table['Area_km2']
+    table['Coverage_pct'] = 100 * table['Area_km2'] / table['Region'].map(region_area)
+    type_cols = sorted(c for c in table if c.endswith('_km2') and c not in
+                       ('Sum_km2', 'Area_km2', 'Overlap_km2'))
+    return table[['Region', 'Sites', 'Area_km2', 'Sum_km2', 'Overlap_km2', 'Coverage_pct'] + type_cols]
+
@@ -1,11 +1,16 @@
 import os
+import sys
 import geopandas as gpd
 import ee
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import rioxarray
 import numpy as np
-from urllib.request import urlretrieve
+
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from ee_downloads import download_all
+from raster_cache import RasterCache, geometry_digest
+from regions import load_regions
 
 # === Initialize Earth Engine ===
 try:
@@ -32,21 +37,16 @@ sarl_colors = {
 }
 
 # === Define Regions ===
-regions_info = [
-    {'region': 'Split_Dalmatia', 'country': 'Croatia', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Croatia\Split_Dalmatia.shp'},
-    {'region': 'Macedonia_Thrace', 'country': 'Greece', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Greece\Macedonia_Thrace.shp'},
-    {'region': 'Potenza', 'country': 'Italy', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Italy\Potenza.shp'},
-    {'region': 'Corse_du_Sud', 'country': 'France', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\France\Corse_du_Sud.shp'},
-    {'region': 'Sardegna', 'country': 'Italy', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Italy\Sardegna.shp'},
-    {'region': 'Beiras_Centro', 'country': 'Portugal', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Portugal\Beiras_Centro.shp'},
-    {'region': 'Nicosia', 'country': 'Cyprus', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Cyprus\Nicosia.shp'},
-    {'region': 'Valencia', 'country': 'Spain', 'shapefile': r'C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\case_study_locations\Spain\Valencia.shp'}
-]
+regions = load_regions()
 
 # === Output Folder ===
 output_dir = "sarl_visuals"
 os.makedirs(output_dir, exist_ok=True)
 
+# === Raster Cache ===
+raster_cache = RasterCache(max_bytes=20e9)
+sarl_scale = 100
+
 # === Function to Convert GeoDataFrame to EE Geometry ===
 def gdf_to_ee(gdf):
     return ee.Geometry(gdf.geometry.union_all().__geo_interface__)
@@ -62,41 +62,53 @@ rivers_path = r"C:\Users\Gebruiker\OneDrive\DesirMED info\Paper\Rivers\HydroRIVE
 rivers_gdf = gpd.read_file(rivers_path)
 rivers_gdf = rivers_gdf.to_crs("EPSG:4326")
 
-# === Process Each Region ===
-for item in regions_info:
+# === Prepare the SARL export of each region ===
+year_band = 'Y2021'
+jobs, region_gdfs, region_params = [], {}, {}
+for item in regions:
     region = item['region']
-    shapefile_path = item['shapefile']
     print(f" Processing {region}...")
 
-    try:
-        gdf = gpd.read_file(shapefile_path)
-    except UnicodeDecodeError:
-        print(f" Encoding issue detected in {region}, retrying with ISO-8859-1...")
-        gdf = gpd.read_file(shapefile_path, encoding='ISO-8859-1')
-
-    gdf = gdf.to_crs("EPSG:4326")
+    gdf = regions.gdf(region)
     ee_geom = gdf_to_ee(gdf)
     bbox = ee_geom.bounds()
 
     # Select SARL year band
-    year_band = 'Y2021'
     band_img = sarl.select(year_band).clip(bbox)
 
     # Mask out background (0), no-data (5, 6)
     mask = band_img.gt(0).And(band_img.lt(5))
     clean_img = band_img.updateMask(mask)
 
-    # Download as GeoTIFF
-    filename = f"{region}_SARL_{year_band}.tif".replace(" ", "_")
-    tif_path = os.path.join(output_dir, filename)
-
-    if not os.path.exists(tif_path):
-        url = clean_img.getDownloadURL({
-            'scale': 100,
-            'region': bbox,
-            'format': 'GEO_TIFF'
-        })
-        urlretrieve(url, tif_path)
+    cache_params = dict(asset="projects/sat-io/open-datasets/SARL", band=year_band,
+                        mask='1-4', scale=sarl_scale,
+                        region=geometry_digest(gdf.geometry.union_all()))
+    region_params[region] = cache_params
+    if raster_cache.get(cache_params) is None:
+        jobs.append(dict(
+            name=region, path=raster_cache.path(cache_params),
+            url=lambda image=clean_img, bbox=bbox: image.getDownloadURL({
+                'scale': sarl_scale,
+                'region': bbox,
+                'format': 'GEO_TIFF'
+            })))
+    region_gdfs[region] = gdf
+
+# === Download SARL GeoTIFFs ===
+download_stats = download_all(jobs, max_workers=4)
+download_stats.to_csv(os.path.join(output_dir, "download_stats.csv"), index=False)
+
+for _, job in download_stats[download_stats['status'] != 'failed'].iterrows():
+    raster_cache.add(region_params[job['name']])
+failed = set(download_stats.loc[download_stats['status'] == 'failed', 'name'])
+print("Raster cache:", raster_cache.stats())
+
+# === Plot Each Region ===
+for region, cache_params in region_params.items():
+    if region in failed:
+        continue
+    tif_path = raster_cache.path(cache_params)
+    gdf = region_gdfs[region]
 
     # Clip river layer to current region
     rivers_clipped = gpd.clip(rivers_gdf, gdf)
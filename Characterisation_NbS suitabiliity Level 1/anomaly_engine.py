@@ -0,0 +1,322 @@
+"""
+Streaming monthly climatology / anomaly engine shared by temperature.py and soil_anomaly.py.
+
+The NOAA files (air.mon.mean.nc, soilw.mon.mean.v2.nc) and the ERA5-Land / CPC
+records are read in time chunks: per-calendar-month sums and counts for the
+baseline window are accumulated in a single pass, and only the target years are
+kept in memory (as float32). The full cube is never loaded.
+
+Example
+-------
+    from anomaly_engine import compute_anomalies, wrap_longitude
+
+    anomaly2024, climatology = compute_anomalies(
+        file_path, 'air', baseline=('1971', '2000'), years=[2024])
+    anomaly2024 = wrap_longitude(anomaly2024)
+
+Regional products pass bbox=(minx, miny, maxx, maxy) in -180..180 degrees:
+only the lat/lon hyperslab of the box is read from disk in every chunk. On a
+0..360 grid a box that crosses 0° (or the dateline) is read as two index runs
+and joined, instead of rewrapping and sorting the global grid. open_subset()
+reads a bbox/time window and converts units after subsetting.
+
+The baseline climatology never changes, so it can be persisted with
+cached_climatology() and monthly refreshes handled by update_anomalies(),
+which only reads and exports the months appended since the previous run.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def wrap_longitude(da, lon_name='lon'):
+    """Convert 0..360 longitudes to -180..180 and sort (apply to small outputs only)."""
+    da = da.assign_coords({lon_name: (da[lon_name] + 180) % 360 - 180})
+    return da.sortby(lon_name)
+
+
+def lon_runs(lon, minx, maxx):
+    """
+    Index slices of `lon` (any convention) inside [minx, maxx] (-180..180), ordered west to east.
+
+    A box crossing the grid seam gives two runs; minx > maxx selects across the dateline.
+    """
+    wrapped = (np.asarray(lon, 'float64') + 180) % 360 - 180
+    if minx <= maxx:
+        inside = (wrapped >= minx) & (wrapped <= maxx)
+    else:
+        inside = (wrapped >= minx) | (wrapped <= maxx)
+    idx = np.flatnonzero(inside)
+    if idx.size == 0:
+        raise ValueError(f"No longitudes inside [{minx}, {maxx}]")
+    order = idx[np.argsort((wrapped[idx] - minx) % 360, kind='stable')]
+    breaks = np.flatnonzero(np.diff(order) != 1) + 1
+    return [slice(int(run[0]), int(run[-1]) + 1) for run in np.split(order, breaks)]
+
+
+def lat_slice(lat, miny, maxy):
+    """Index slice of the `lat` cell centres inside [miny, maxy] (either orientation)."""
+    idx = np.flatnonzero((np.asarray(lat) >= miny) & (np.asarray(lat) <= maxy))
+    if idx.size == 0:
+        raise ValueError(f"No latitudes inside [{miny}, {maxy}]")
+    return slice(int(idx[0]), int(idx[-1]) + 1)
+
+
+def time_slice(times, start=None, end=None):
+    """Index slice of `times` for partial dates, end inclusive (like .sel(time=slice(...)))."""
+    return pd.DatetimeIndex(times).slice_indexer(start, end)
+
+
+def _hyperslab(da, bbox, lat='lat', lon='lon'):
+    """(lat slice, lon runs, lon coordinate) of `bbox`; the whole grid if bbox is None."""
+    if bbox is None:
+        return slice(None), [slice(None)], da[lon].values
+    minx, miny, maxx, maxy = bbox
+    runs = lon_runs(da[lon].values, minx, maxx)
+    lon_values = np.concatenate([da[lon].values[r] for r in runs])
+    return lat_slice(da[lat].values, miny, maxy), runs, (lon_values + 180) % 360 - 180
+
+
+def _read_block(da, time_sel, lat_sel, runs, lat='lat', lon='lon'):
+    blocks = [da.isel({'time': time_sel, lat: lat_sel, lon: r}).values for r in runs]
+    return blocks[0] if len(blocks) == 1 else np.concatenate(blocks, axis=da.dims.index(lon))
+
+
+UNIT_CONVERSIONS = {
+    ('K', 'degC'): (1.0, -273.15),
+    ('degK', 'degC'): (1.0, -273.15),
+    ('m', 'mm'): (1000.0, 0.0),
+    ('kg/m^2', 'mm'): (1.0, 0.0),
+}
+
+
+def convert_units(da, units):
+    """Linear unit conversion based on da.attrs['units'] (no-op if already in `units`)."""
+    src = da.attrs.get('units')
+    if units is None or src == units:
+        return da
+    if (src, units) not in UNIT_CONVERSIONS:
+        raise ValueError(f"No conversion from {src!r} to {units!r}")
+    scale, offset = UNIT_CONVERSIONS[(src, units)]
+    return (da * scale + offset).astype(da.dtype).assign_attrs(da.attrs, units=units)
+
+
+def open_subset(file_path, var_name, bbox=None, time=None, units=None):
+    """
+    Read only the bbox/time hyperslab of `var_name` into memory.
+
+    bbox is (minx, miny, maxx, maxy) in -180..180 degrees, time a (start, end)
+    pair of partial dates (end inclusive). Longitudes of the result are in
+    -180..180. Units are converted after subsetting.
+    """
+    with xr.open_dataset(file_path, cache=False) as ds:
+        da = ds[var_name]
+        if da.dims[0] != 'time':
+            da = da.transpose('time', ...)
+        t_sel = time_slice(da['time'].values, *time) if time is not None else slice(None)
+        lat_sel, runs, lon_values = _hyperslab(da, bbox)
+        values = _read_block(da, t_sel, lat_sel, runs)
+        subset = xr.DataArray(
+            values, dims=da.dims,
+            coords={'time': da['time'].values[t_sel], 'lat': da['lat'].values[lat_sel],
+                    'lon': lon_values},
+            name=var_name, attrs=da.attrs)
+    return convert_units(subset, units)
+
+
+def _time_masks(times, baseline, years):
+    times = pd.DatetimeIndex(times)
+    # Same semantics as .sel(time=slice('1971', '2000')): partial dates, end inclusive
+    in_base = np.zeros(len(times), bool)
+    in_base[times.slice_indexer(str(baseline[0]), str(baseline[1]))] = True
+    in_target = np.isin(times.year, list(years)) if years is not None else np.zeros(len(times), bool)
+    return in_base, in_target
+
+
+def _iter_chunks(positions, chunk_size):
+    """Yield contiguous (start, stop) index ranges covering the needed time steps."""
+    if len(positions) == 0:
+        return
+    first, last = int(positions.min()), int(positions.max()) + 1
+    needed = np.zeros(last - first, bool)
+    needed[positions - first] = True
+    for start in range(first, last, chunk_size):
+        stop = min(start + chunk_size, last)
+        if needed[start - first:stop - first].any():
+            yield start, stop
+
+
+def _climatology_array(sums, counts, template, months=range(1, 13)):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    spatial_dims = template.dims[1:]
+    coords = {d: template[d] for d in spatial_dims if d in template.coords}
+    coords['month'] = list(months)
+    return xr.DataArray(mean.astype('float32'), dims=('month',) + spatial_dims,
+                        coords=coords, name=template.name, attrs=template.attrs)
+
+
+def compute_anomalies(file_path, var_name, baseline=('1971', '2000'), years=None,
+                      chunk_size=60, bbox=None):
+    """
+    Climatology for `baseline` and anomalies for `years` from one pass over `file_path`.
+
+    Returns (anomaly, climatology). `anomaly` has the target time steps only
+    (float32); `climatology` has a `month` dimension (1..12). Pass years=None to
+    get the climatology only (anomaly is then None). With `bbox` only that
+    hyperslab is read and both outputs have -180..180 longitudes.
+    """
+    with xr.open_dataset(file_path, cache=False) as ds:
+        da = ds[var_name]
+        if da.dims[0] != 'time':
+            da = da.transpose('time', ...)
+        in_base, in_target = _time_masks(da['time'].values, baseline, years)
+        months = da['time'].dt.month.values
+        lat_sel, runs, lon_values = _hyperslab(da, bbox)
+        coords = {'lat': da['lat'].values[lat_sel], 'lon': lon_values}
+        spatial_shape = (len(coords['lat']), len(coords['lon']))
+
+        sums = np.zeros((12,) + spatial_shape, 'float64')
+        counts = np.zeros((12,) + spatial_shape, 'int32')
+        target_idx = np.flatnonzero(in_target)
+        target = np.empty((len(target_idx),) + spatial_shape, 'float32')
+        target_pos = {t: i for i, t in enumerate(target_idx)}
+
+        for start, stop in _iter_chunks(np.flatnonzero(in_base | in_target), chunk_size):
+            values = _read_block(da, slice(start, stop), lat_sel, runs)
+            chunk_months = months[start:stop]
+            chunk_base = in_base[start:stop]
+            for m in np.unique(chunk_months[chunk_base]):
+                sel = values[chunk_base & (chunk_months == m)]
+                valid = ~np.isnan(sel)
+                sums[m - 1] += np.where(valid, sel, 0.0).sum(axis=0, dtype='float64')
+                counts[m - 1] += valid.sum(axis=0, dtype='int32')
+            for t in range(start, stop):
+                if in_target[t]:
+                    target[target_pos[t]] = values[t - start]
+
+        template = xr.DataArray(np.empty((1,) + spatial_shape, 'float32'), dims=da.dims,
+                                coords=coords, name=da.name, attrs=da.attrs)
+        climatology = _climatology_array(sums, counts, template)
+        if years is None:
+            return None, climatology
+
+        target_months = months[target_idx]
+        anomaly = target - climatology.values[target_months - 1]
+        anomaly = xr.DataArray(
+            anomaly.astype('float32'), dims=da.dims,
+            coords={'time': da['time'].values[target_idx], **coords},
+            name=var_name, attrs=da.attrs)
+        anomaly['month'] = ('time', target_months)
+    return anomaly, climatology
+
+
+def monthly_climatology(file_path, var_name, baseline=('1971', '2000'), chunk_size=60, bbox=None):
+    """Per-calendar-month mean over `baseline`, streamed in time chunks."""
+    return compute_anomalies(file_path, var_name, baseline, None, chunk_size, bbox)[1]
+
+
+def baseline_fingerprint(file_path, var_name, baseline=('1971', '2000')):
+    """
+    Identity of the baseline data: dataset title, variable, grid, baseline time steps
+    and a checksum of the first and last baseline slices.
+
+    Appending new months to the file leaves it unchanged; a reprocessed dataset
+    version or a different grid does not.
+    """
+    with xr.open_dataset(file_path, cache=False) as ds:
+        da = ds[var_name]
+        in_base, _ = _time_masks(da['time'].values, baseline, None)
+        base_idx = np.flatnonzero(in_base)
+        h = hashlib.sha1()
+        h.update(json.dumps([os.path.basename(file_path), str(ds.attrs.get('title', '')),
+                             var_name, [str(b) for b in baseline]]).encode('utf-8'))
+        for d in da.dims[1:]:
+            h.update(np.asarray(da[d].values, 'float64').tobytes())
+        h.update(np.asarray(da['time'].values[base_idx]).astype('datetime64[ns]').tobytes())
+        for t in (base_idx[:1].tolist() + base_idx[-1:].tolist()):
+            h.update(np.ascontiguousarray(da.isel(time=t).values, dtype='float32').tobytes())
+    return h.hexdigest()[:16]
+
+
+def cached_climatology(file_path, var_name, baseline=('1971', '2000'),
+                       cache_dir=os.path.join('data', 'climatology_cache'), chunk_size=60, bbox=None):
+    """Monthly climatology, loaded from `cache_dir` if present, else computed once and stored."""
+    os.makedirs(cache_dir, exist_ok=True)
+    key = baseline_fingerprint(file_path, var_name, baseline)
+    region = '' if bbox is None else '_' + '_'.join(f"{b:g}" for b in bbox)
+    path = os.path.join(cache_dir, f"{var_name}_{baseline[0]}-{baseline[1]}{region}_{key}.nc")
+    if os.path.exists(path):
+        with xr.open_dataarray(path) as clim:
+            return clim.load()
+    climatology = monthly_climatology(file_path, var_name, baseline, chunk_size, bbox)
+    climatology.attrs.update({'source': os.path.basename(file_path),
+                              'baseline': f"{baseline[0]}-{baseline[1]}", 'fingerprint': key})
+    climatology.to_netcdf(path)
+    return climatology
+
+
+def anomalies_after(file_path, var_name, climatology, after=None, bbox=None):
+    """
+    Anomalies of the time steps later than `after` (all steps if None), reading only those.
+
+    `climatology` must cover the same `bbox` (see cached_climatology).
+    """
+    with xr.open_dataset(file_path, cache=False) as ds:
+        da = ds[var_name]
+        if da.dims[0] != 'time':
+            da = da.transpose('time', ...)
+        times = pd.DatetimeIndex(da['time'].values)
+        idx = np.arange(len(times)) if after is None else np.flatnonzero(times > pd.Timestamp(after))
+        if len(idx) == 0:
+            return None
+        lat_sel, runs, lon_values = _hyperslab(da, bbox)
+        values = _read_block(da, slice(int(idx[0]), int(idx[-1]) + 1), lat_sel, runs)
+        months = times.month.values[idx]
+        anomaly = (values - climatology.values[months - 1]).astype('float32')
+        result = xr.DataArray(
+            anomaly, dims=da.dims,
+            coords={'time': times[idx], 'lat': da['lat'].values[lat_sel], 'lon': lon_values},
+            name=var_name, attrs=da.attrs)
+        result['month'] = ('time', months)
+    return result
+
+
+def update_anomalies(file_path, var_name, export, state_file, baseline=('1971', '2000'),
+                     cache_dir=os.path.join('data', 'climatology_cache'), first_year=None, bbox=None):
+    """
+    Incremental refresh: compute and export only the months added since the last run.
+
+    `export(da_month)` is called for each new month (a single-time-step DataArray,
+    longitudes already wrapped to -180..180). The last exported month is kept in
+    `state_file` (JSON). On the first run, months from `first_year` on are exported
+    (all months if None). With `bbox` only that region is read. Returns the list
+    of exported timestamps.
+    """
+    climatology = cached_climatology(file_path, var_name, baseline, cache_dir, bbox=bbox)
+    last = None
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            last = json.load(f).get('last_exported')
+    elif first_year is not None:
+        last = pd.Timestamp(f"{first_year}-01-01") - pd.Timedelta(days=1)
+
+    anomaly = anomalies_after(file_path, var_name, climatology, last, bbox)
+    if anomaly is None:
+        print("No new months to process.")
+        return []
+    if bbox is None:
+        anomaly = wrap_longitude(anomaly)
+
+    exported = []
+    for i in range(anomaly.sizes['time']):
+        export(anomaly.isel(time=slice(i, i + 1)))
+        exported.append(pd.Timestamp(anomaly['time'].values[i]))
+        with open(state_file, 'w') as f:
+            json.dump({'last_exported': exported[-1].isoformat(), 'source': os.path.basename(file_path),
+                       'variable': var_name, 'baseline': list(baseline)}, f, indent=2)
+    return exported
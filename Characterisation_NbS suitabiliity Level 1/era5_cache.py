@@ -0,0 +1,208 @@
+"""
+Local chunked Zarr cache of monthly Earth Engine image collections (e.g. ERA5-Land precipitation).
+
+The store is keyed by collection, band, projection and bounds. On every run only
+the months that are not yet stored are fetched and appended, after which the
+cube is read from the local store. Months the source did not return (not
+published yet, or before the start of the record) are noted in a JSON file
+next to the store and only asked for again after `recheck_days`. Chunks are
+large along time and small in space, so reading a per-pixel time series (as
+the SPI does) touches few chunks.
+
+A fetcher is any function fetch(start, end) -> DataArray for the months in
+[start, end). ee_fetcher() pulls from Earth Engine through the `ee` xarray
+engine; local_fetcher() reads a local NetCDF/Zarr file and stands in for the
+remote source when working offline.
+
+Example
+-------
+    from era5_cache import cached_cube, ee_fetcher
+
+    fetch = ee_fetcher('ECMWF/ERA5_LAND/MONTHLY_AGGR', 'total_precipitation_sum', bounds)
+    da = cached_cube(fetch, 'ECMWF/ERA5_LAND/MONTHLY_AGGR', 'total_precipitation_sum',
+                     projection='EPSG:4326@0.1', bounds=bounds.bounds,
+                     start='2000-01-01', end='2025-01-01')
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+DEFAULT_CHUNKS = {'time': 120, 'lat': 32, 'lon': 32}
+
+
+def cache_key(collection, band, projection, bounds):
+    """Short hash identifying a (collection, band, projection, bounds) cube."""
+    bounds = [round(float(b), 6) for b in bounds]
+    payload = json.dumps([collection, band, projection, bounds], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def store_path(cache_dir, collection, band, projection, bounds):
+    name = re.sub(r'[^A-Za-z0-9]+', '_', f"{collection}_{band}").strip('_')
+    return os.path.join(cache_dir, f"{name}_{cache_key(collection, band, projection, bounds)}.zarr")
+
+
+def requested_months(start, end):
+    """Month starts in [start, end), the same convention as ee.Filter.date."""
+    return pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq='MS', inclusive='left')
+
+
+def stored_months(path, time_dim='time'):
+    if not os.path.exists(path):
+        return pd.DatetimeIndex([])
+    with xr.open_zarr(path) as ds:
+        return pd.DatetimeIndex(ds[time_dim].values)
+
+
+def missing_month_ranges(requested, stored):
+    """Contiguous [start, end) ranges of requested months that are not stored yet."""
+    have = set(stored.to_period('M'))
+    missing = [m for m in requested if m.to_period('M') not in have]
+    ranges = []
+    for m in missing:
+        if ranges and ranges[-1][1] == m:
+            ranges[-1][1] = m + pd.offsets.MonthBegin(1)
+        else:
+            ranges.append([m, m + pd.offsets.MonthBegin(1)])
+    return [(a, b) for a, b in ranges]
+
+
+def unavailable_path(path):
+    """JSON file next to the store with the months the source did not have, and when they were asked for."""
+    return os.path.splitext(path)[0] + '_unavailable.json'
+
+
+def _load_unavailable(path):
+    if not os.path.exists(unavailable_path(path)):
+        return {}
+    with open(unavailable_path(path)) as f:
+        return json.load(f)
+
+
+def _save_unavailable(path, unavailable):
+    tmp_path = unavailable_path(path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(sorted(unavailable.items())), f, indent=1)
+    os.replace(tmp_path, unavailable_path(path))
+
+
+def _prepare(da, band, chunks, time_dim):
+    da = da.transpose(time_dim, ...).astype('float32')
+    da.encoding = {}
+    da = da.rename(band)
+    enc_chunks = tuple(min(chunks.get(d, n), n) if d != time_dim else chunks.get(d, n)
+                       for d, n in zip(da.dims, da.shape))
+    return da.to_dataset(), {band: {'chunks': enc_chunks}}
+
+
+def update_cache(path, fetch, band, start, end, chunks=None, attrs=None, time_dim='time',
+                 recheck_days=1, now=None):
+    """
+    Fetch the months in [start, end) that are missing from the Zarr store at `path`.
+
+    Months after the last stored one are appended along time; a gap before it
+    (backfill) rewrites the store. Months the source does not return are
+    recorded and skipped until `recheck_days` have passed since they were last
+    asked for. Returns the list of months that were added.
+    """
+    chunks = chunks or DEFAULT_CHUNKS
+    now = pd.Timestamp(now) if now is not None else pd.Timestamp.now()
+    stored = stored_months(path, time_dim)
+    unavailable = _load_unavailable(path)
+    recent = {month for month, checked in unavailable.items()
+              if now - pd.Timestamp(checked) < pd.Timedelta(days=recheck_days)}
+    requested = pd.DatetimeIndex([m for m in requested_months(start, end)
+                                  if m.strftime('%Y-%m') not in recent])
+    added = []
+    for range_start, range_end in missing_month_ranges(requested, stored):
+        new = fetch(range_start, range_end)
+        got = set() if new is None else set(pd.DatetimeIndex(new[time_dim].values).strftime('%Y-%m'))
+        for month in requested_months(range_start, range_end).strftime('%Y-%m'):
+            if month in got:
+                unavailable.pop(month, None)
+            else:
+                unavailable[month] = now.isoformat()
+        if not got:
+            continue
+        ds_new, encoding = _prepare(new, band, chunks, time_dim)
+        ds_new.attrs.update(attrs or {})
+        new_times = pd.DatetimeIndex(ds_new[time_dim].values)
+
+        if len(stored) == 0:
+            ds_new.to_zarr(path, mode='w', encoding=encoding)
+        elif new_times.min() > stored.max():
+            ds_new.to_zarr(path, append_dim=time_dim)
+        else:
+            # Backfill: rewrite the store in time order
+            tmp_path = path + '.tmp'
+            with xr.open_zarr(path) as ds_old:
+                merged = xr.concat([ds_old.load(), ds_new], dim=time_dim).sortby(time_dim)
+            merged[band].encoding = {}
+            merged.to_zarr(tmp_path, mode='w', encoding=encoding)
+            shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        stored = stored.append(new_times).sort_values()
+        added.extend(new_times)
+    if unavailable or os.path.exists(unavailable_path(path)):
+        _save_unavailable(path, unavailable)
+    return added
+
+
+def cached_cube(fetch, collection, band, projection, bounds, start, end,
+                cache_dir=os.path.join('data', 'era5_cache'), chunks=None, recheck_days=1):
+    """
+    Update the local store for (collection, band, projection, bounds) and open it.
+
+    Returns the band as a lazily loaded DataArray covering [start, end) (months
+    the source does not have yet are absent).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = store_path(cache_dir, collection, band, projection, bounds)
+    attrs = {'collection': collection, 'band': band, 'projection': str(projection),
+             'bounds': json.dumps([float(b) for b in bounds])}
+    added = update_cache(path, fetch, band, start, end, chunks=chunks, attrs=attrs,
+                         recheck_days=recheck_days)
+    print(f"{os.path.basename(path)}: {len(added)} new month(s) fetched")
+    da = xr.open_zarr(path)[band]
+    times = requested_months(start, end)
+    return da.sel(time=slice(times.min(), times.max()))
+
+
+def ee_fetcher(collection, band, geometry, projection=None):
+    """Fetcher that pulls months from Earth Engine through the `ee` xarray engine."""
+    def fetch(start, end):
+        import ee
+
+        ic = ee.ImageCollection(collection) \
+            .filter(ee.Filter.date(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))) \
+            .select(band)
+        if ic.size().getInfo() == 0:
+            return None
+        ds = xr.open_dataset(ic, engine='ee',
+                             projection=projection or ic.first().select(0).projection(),
+                             geometry=geometry)
+        return ds[band].transpose('time', 'lat', 'lon').load()
+    return fetch
+
+
+def local_fetcher(path, band, bounds=None):
+    """Offline stand-in for the remote source: read months from a local NetCDF/Zarr file."""
+    def fetch(start, end):
+        ds = xr.open_zarr(path) if path.endswith('.zarr') else xr.open_dataset(path)
+        with ds:
+            da = ds[band]
+            times = pd.DatetimeIndex(da['time'].values)
+            da = da.isel(time=np.flatnonzero((times >= start) & (times < end)))
+            if bounds is not None:
+                minx, miny, maxx, maxy = bounds
+                lat = da['lat'].values
+                lat_slice = slice(miny, maxy) if lat[0] <= lat[-1] else slice(maxy, miny)
+                da = da.sel(lon=slice(minx, maxx), lat=lat_slice)
+            return da.load()
+    return fetch
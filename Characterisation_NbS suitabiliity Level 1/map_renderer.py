@@ -0,0 +1,178 @@
+"""
+Headless batch renderer for the 12-panel (6 x 2) monthly cartopy maps of the level-1 scripts.
+
+Figures are drawn on their own Agg canvas (no GUI, no plt.show(), and the
+pyplot backend of the calling session is left alone) and written straight to
+PNG. Several figures are rendered in a process pool. The coastlines are
+projected once per projection/extent in the parent and handed to every figure
+that uses them, and the data are cropped to the map extent and block-averaged
+down to the panel's pixel resolution before plotting.
+
+Example
+-------
+    from map_renderer import render_figures
+
+    common = dict(cmap='RdBu_r', vmin=-5, vmax=5,
+                  cbar_label='Surface Air Temperature Anomaly (°C)')
+    render_figures([
+        dict(da=anomaly2024, out_png='figures/temperature_global_2024.png',
+             projection='EqualEarth', title='Global Surface Temperature Anomaly - 2024', **common),
+        dict(da=anomaly2024, out_png='figures/temperature_MED_2024.png',
+             projection='Mercator', extent=(-10, 35, 30, 50),
+             title='Mediterranean Temperature Anomaly - 2024', **common),
+    ], n_workers=2)
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+
+FIG_SIZE = (11.7, 16.5)
+N_ROWS, N_COLS = 6, 2
+
+
+@lru_cache(maxsize=None)
+def projected_coastlines(projection, extent=None, resolution='110m'):
+    """Natural Earth coastlines projected once into `projection` (cached per process)."""
+    import cartopy.crs as ccrs
+    import cartopy.feature as cfeature
+    from shapely.geometry import box
+
+    target = getattr(ccrs, projection)()
+    geoms = cfeature.NaturalEarthFeature('physical', 'coastline', resolution).geometries()
+    if extent is not None:
+        minx, maxx, miny, maxy = extent
+        clip = box(minx - 5, miny - 5, maxx + 5, maxy + 5)
+        geoms = (g.intersection(clip) for g in geoms if g.intersects(clip))
+    src = ccrs.PlateCarree()
+    return tuple(p for p in (target.project_geometry(g, src) for g in geoms) if not p.is_empty)
+
+
+def _coastline_resolution(extent):
+    return '110m' if extent is None else '50m'
+
+
+def prepare_panels(da, extent=None, fig_size=FIG_SIZE, dpi=150, lon='lon', lat='lat'):
+    """
+    Crop `da` (time, lat, lon) to `extent` and block-average it to the panel resolution.
+
+    A panel is about fig_width * dpi / N_COLS pixels wide; plotting more grid
+    cells than that only costs time.
+    """
+    if extent is not None:
+        minx, maxx, miny, maxy = extent
+        lats = da[lat].values
+        lat_slice = slice(miny, maxy) if lats[0] <= lats[-1] else slice(maxy, miny)
+        da = da.sel({lon: slice(minx, maxx), lat: lat_slice})
+    panel_px = (fig_size[0] * dpi / N_COLS, fig_size[1] * dpi / N_ROWS)
+    factors = {lon: int(da.sizes[lon] // panel_px[0]), lat: int(da.sizes[lat] // panel_px[1])}
+    factors = {d: f for d, f in factors.items() if f > 1}
+    if factors:
+        da = da.coarsen(factors, boundary='trim').mean()
+    return da
+
+
+def render_monthly_figure(da, out_png, projection='EqualEarth', extent=None, cmap='RdBu_r',
+                          vmin=-5, vmax=5, cbar_label='', title='', dpi=150,
+                          coastline_resolution=None, coastlines=None):
+    """
+    Draw up to 12 monthly panels of `da` (time, lat, lon) in a 6 x 2 figure and save as PNG.
+
+    `coastlines` are geometries already projected into `projection` (see
+    projected_coastlines); they are projected here if not given.
+    """
+    import cartopy.crs as ccrs
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if coastline_resolution is None:
+        coastline_resolution = _coastline_resolution(extent)
+    proj = getattr(ccrs, projection)()
+    if coastlines is None:
+        coastlines = projected_coastlines(projection, extent, coastline_resolution)
+    lon, lat = da['lon'].values, da['lat'].values
+    # Regular grid drawn as an image warped once to the panel resolution
+    # (much cheaper than a projected pcolormesh of every cell)
+    dx = abs(lon[1] - lon[0]) / 2 if lon.size > 1 else 0.5
+    dy = abs(lat[1] - lat[0]) / 2 if lat.size > 1 else 0.5
+    img_extent = (lon.min() - dx, lon.max() + dx, lat.min() - dy, lat.max() + dy)
+    origin = 'upper' if lat.size > 1 and lat[0] > lat[-1] else 'lower'
+    regrid_shape = (int(FIG_SIZE[1] * dpi / N_ROWS), int(FIG_SIZE[0] * dpi / N_COLS))
+
+    fig = Figure(figsize=FIG_SIZE, layout='constrained')
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(N_ROWS, N_COLS, sharex=True, sharey=True, subplot_kw={'projection': proj})
+
+    im = None
+    for index, ax in enumerate(axes.flat):
+        if index < da.sizes['time']:
+            data = da.isel(time=index)
+            im = ax.imshow(data.values, transform=ccrs.PlateCarree(), extent=img_extent,
+                           origin=origin, cmap=cmap, vmin=vmin, vmax=vmax,
+                           regrid_shape=regrid_shape, interpolation='nearest')
+            ax.set_title(pd.to_datetime(data.time.values).strftime('%Y-%b'), fontsize=9)
+            ax.set_aspect('auto')
+            if extent is not None:
+                ax.set_extent(extent, crs=ccrs.PlateCarree())
+            ax.add_geometries(coastlines, crs=proj, facecolor='none', edgecolor='black', linewidth=0.5)
+            ax.gridlines(draw_labels=False)
+        else:
+            ax.set_visible(False)
+
+    if im is not None:
+        fig.colorbar(im, ax=axes[N_ROWS - 1, :N_COLS], shrink=0.4, pad=0.05, location='bottom',
+                     label=cbar_label)
+    fig.suptitle(title, fontsize=16)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_png)), exist_ok=True)
+    fig.savefig(out_png, dpi=dpi)
+    return out_png
+
+
+def _render_job(job):
+    return render_monthly_figure(**job)
+
+
+def render_figures(jobs, n_workers=None, dpi=150):
+    """
+    Render a list of figure jobs (keyword arguments of render_monthly_figure) in a process pool.
+
+    The data of every job are cropped and downsampled in the parent first, so
+    only small arrays are sent to the workers, and the coastlines are projected
+    once per (projection, extent) in the parent and shared by all jobs using
+    them. Returns the written PNG paths.
+    """
+    prepared = []
+    for job in jobs:
+        job = dict(job, dpi=job.get('dpi', dpi))
+        job['da'] = prepare_panels(job['da'], job.get('extent'), dpi=job['dpi']).load()
+        if job.get('coastlines') is None:
+            extent = job.get('extent')
+            resolution = job.get('coastline_resolution') or _coastline_resolution(extent)
+            job['coastlines'] = projected_coastlines(job.get('projection', 'EqualEarth'),
+                                                     None if extent is None else tuple(extent),
+                                                     resolution)
+        prepared.append(job)
+
+    n_workers = n_workers or min(len(prepared), os.cpu_count())
+    if n_workers <= 1:
+        paths = [_render_job(job) for job in prepared]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            paths = list(pool.map(_render_job, prepared))
+    for path in paths:
+        print("Wrote:", path)
+    return paths
+
+
+def monthly_figure_jobs(da, name, year, label, cmap, vmin, vmax, out_dir, title_global,
+                        title_med, med_extent=(-10, 35, 30, 50)):
+    """The global EqualEarth + Mediterranean Mercator figure pair drawn by each level-1 script."""
+    common = dict(da=da, cmap=cmap, vmin=vmin, vmax=vmax, cbar_label=label)
+    return [
+        dict(out_png=os.path.join(out_dir, f"{name}_global_{year}.png"),
+             projection='EqualEarth', title=title_global, **common),
+        dict(out_png=os.path.join(out_dir, f"{name}_MED_{year}.png"),
+             projection='Mercator', extent=tuple(med_extent), title=title_med, **common),
+    ]
@@ -0,0 +1,86 @@
+"""
+Export of monthly anomaly time series as a single multi-band Cloud-Optimized GeoTIFF.
+
+One band per time step (band description = the month, e.g. '2024-03'),
+tiled, with internal overviews. Block compression runs in parallel threads
+through GDAL's NUM_THREADS option. NetCDF and Zarr outputs are available for
+users that want the time axis kept as a dimension.
+
+Example
+-------
+    from raster_export import to_spatial, write_time_series
+
+    da = to_spatial(anomaly2024)                    # lon/lat -> x/y, EPSG:4326, float32
+    write_time_series(da, 'temperature_anomaly_MED_2024.tif')
+    write_time_series(da, 'temperature_anomaly_MED_2024.nc')
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import rioxarray  # noqa: F401  (registers the .rio accessor)
+
+
+def to_spatial(da, crs="EPSG:4326"):
+    """Rename lon/lat to x/y, set spatial dims, CRS and float32 dtype."""
+    da = da.rename({'lon': 'x', 'lat': 'y'}) if 'lon' in da.dims else da
+    da = da.rio.set_spatial_dims(x_dim='x', y_dim='y')
+    da = da.rio.write_crs(crs)
+    return da.astype('float32')
+
+
+def band_descriptions(da, time_dim='time', fmt="%Y-%m"):
+    return tuple(pd.to_datetime(da[time_dim].values).strftime(fmt))
+
+
+def write_cog(da, out_file, time_dim='time', compress='DEFLATE', blocksize=256,
+              num_threads='ALL_CPUS', nodata=np.nan, overview_resampling='AVERAGE'):
+    """
+    Write a (time, y, x) DataArray as one tiled COG, one band per time step.
+
+    Returns the output path.
+    """
+    da = da.transpose(time_dim, 'y', 'x')
+    descriptions = band_descriptions(da, time_dim)
+    # rioxarray writes a tuple-valued long_name as the band descriptions
+    da = da.assign_attrs(long_name=descriptions)
+    da = da.drop_vars([c for c in da.coords if c not in (time_dim, 'x', 'y', 'spatial_ref')])
+    da = da.rio.write_nodata(nodata, encoded=False)
+    da.rio.to_raster(
+        out_file,
+        driver="COG",
+        compress=compress,
+        blocksize=blocksize,
+        num_threads=str(num_threads),
+        overviews='AUTO',
+        overview_resampling=overview_resampling,
+        predictor='FLOATING_POINT' if np.issubdtype(da.dtype, np.floating) else 'YES',
+        BIGTIFF='IF_SAFER',
+    )
+    return out_file
+
+
+def write_netcdf(da, out_file, complevel=4):
+    name = da.name or 'anomaly'
+    ds = da.to_dataset(name=name)
+    ds.to_netcdf(out_file, encoding={name: {'zlib': True, 'complevel': complevel}})
+    return out_file
+
+
+def write_zarr(da, out_file, time_dim='time'):
+    name = da.name or 'anomaly'
+    chunks = {d: (1 if d == time_dim else min(512, n)) for d, n in da.sizes.items()}
+    da.to_dataset(name=name).chunk(chunks).to_zarr(out_file, mode='w')
+    return out_file
+
+
+def write_time_series(da, out_file, **kwargs):
+    """Write `da` to .tif (multi-band COG), .nc (NetCDF) or .zarr, by extension."""
+    ext = os.path.splitext(out_file)[1].lower()
+    if ext in ('.tif', '.tiff'):
+        return write_cog(da, out_file, **kwargs)
+    if ext == '.nc':
+        return write_netcdf(da, out_file, **kwargs)
+    if ext == '.zarr':
+        return write_zarr(da, out_file, **kwargs)
+    raise ValueError(f"Unsupported output format: {out_file}")
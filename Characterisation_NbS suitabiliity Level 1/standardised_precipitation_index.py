@@ -9,6 +9,8 @@ from climate_indices import indices
 import matplotlib.pyplot as plt
 import geopandas as gpd
 import numpy as np
+from era5_cache import cached_cube, ee_fetcher
+from spi_engine import spi_dataarray, spi_multiscale, compare_with_climate_indices, benchmark_parallel_spi
 
 # Set connection pool size for Earth Engine to avoid warnings
 os.environ['PYTHON_EE_CONNECTION_POOL_SIZE'] = '50'
@@ -57,29 +59,41 @@ country = gdf[gdf['SOV_A3'] == 'ITA']   # Italy
 
 
 # Define Earth Engine ERA5 dataset and filter by date
-era5 = ee.ImageCollection('ECMWF/ERA5_LAND/MONTHLY_AGGR') \
-    .filter(ee.Filter.date('2000-01-01', '2025-01-01')) \
-    .select('total_precipitation_sum')
+era5_collection = 'ECMWF/ERA5_LAND/MONTHLY_AGGR'
+era5_band = 'total_precipitation_sum'
+start_date, end_date = '2000-01-01', '2025-01-01'
+era5 = ee.ImageCollection(era5_collection) \
+    .filter(ee.Filter.date(start_date, end_date)) \
+    .select(era5_band)
 
 # Convert country geometry to EE and get bounds
 geometry = country.geometry.union_all()
 bounds = geometry.bounds
+projection = era5.first().select(0).projection()
+
+# Read through a local Zarr store (data/era5_cache) that only fetches months not yet stored;
+# set to False to open the full period from Earth Engine on every run
+use_local_cache = True
 
 # ⚠ This part may not work without a custom xarray engine. Replace as needed.
 
-ds = xr.open_dataset(
-    era5,
-    engine='ee',
-    projection=era5.first().select(0).projection(),
-    geometry=bounds
-)
+if use_local_cache:
+    fetch = ee_fetcher(era5_collection, era5_band, geometry=bounds, projection=projection)
+    ds = cached_cube(fetch, era5_collection, era5_band,
+                     projection=projection.getInfo(), bounds=bounds,
+                     start=start_date, end=end_date,
+                     cache_dir=os.path.join(data_folder, 'era5_cache')).to_dataset()
+else:
+    ds = xr.open_dataset(
+        era5,
+        engine='ee',
+        projection=projection,
+        geometry=bounds
+    )
 
 # Extract and preprocess data
 da = ds.total_precipitation_sum
-da = da.sortby(['lat', 'lon']).fillna(0.0)
-
-# Group data by pixel for SPI computation
-da_precip_groupby = da.stack(pixel=('lat', 'lon')).groupby('pixel')
+da = da.sortby(['lat', 'lon'])
 
 # SPI configuration
 scale = 3
@@ -89,6 +103,16 @@ calibration_year_initial = 2000
 calibration_year_final = 2024
 periodicity = climate_indices.compute.Periodicity.monthly
 
+# 'vectorized' fits the whole grid at once (spi_engine.py, no-data pixels masked out);
+# 'climate_indices' is the original per-pixel reference implementation
+spi_method = 'vectorized'
+check_against_reference = False  # compare a sample of pixels with climate_indices
+n_workers = 1                     # >1 (or None for all cores) fits spatial tiles in a process pool
+tile_size = (64, 64)              # (lat, lon) pixels per tile for the parallel mode
+run_scaling_benchmark = False     # time the vectorized SPI for 1..N workers
+spi_scales = [1, 3, 6, 12, 24]    # accumulation periods for the multi-scale Dataset
+compute_multiscale = False        # all spi_scales in one pass (shared cumulative sums)
+
 # Function to calculate SPI for a pixel
 def calculate_spi(group):
     spi_values = climate_indices.indices.spi(
@@ -105,13 +129,39 @@ def calculate_spi(group):
 # --- TIMED SPI calculation ---
 start = time.time()
 
-da_spi = da_precip_groupby.apply(calculate_spi)
+if spi_method == 'vectorized':
+    da_spi = spi_dataarray(da.transpose('time', 'lat', 'lon'), scale,
+                           calibration_year_initial, calibration_year_final,
+                           n_workers=n_workers, tile_size=tile_size)
+else:
+    # Group data by pixel for SPI computation (missing months stay NaN, as in the vectorized mode)
+    da_precip_groupby = da.stack(pixel=('lat', 'lon')).groupby('pixel')
+    da_spi = da_precip_groupby.apply(calculate_spi)
+    # Convert back to 2D
+    da_spi = da_spi.unstack('pixel')
 
 end = time.time()
-print(f"SPI calculation completed in {end - start:.2f} seconds")
-
-# Convert back to 2D
-da_spi = da_spi.unstack('pixel')
+print(f"SPI calculation ({spi_method}) completed in {end - start:.2f} seconds")
+
+if check_against_reference and spi_method == 'vectorized':
+    max_diff = compare_with_climate_indices(da, da_spi, scale,
+                                            calibration_year_initial, calibration_year_final)
+    print(f"Max abs difference to climate_indices (sampled pixels): {max_diff:.2e}"
+          + (" (NaN patterns differ)" if np.isinf(max_diff) else ""))
+
+if compute_multiscale:
+    start = time.time()
+    ds_spi = spi_multiscale(da.transpose('time', 'lat', 'lon'), scales=spi_scales,
+                            calibration_year_initial=calibration_year_initial,
+                            calibration_year_final=calibration_year_final,
+                            n_workers=n_workers, tile_size=tile_size)
+    print(f"Multi-scale SPI {spi_scales} completed in {time.time() - start:.2f} seconds")
+    ds_spi.to_netcdf(os.path.join(output_folder, 'spi_multiscale.nc'))
+
+if run_scaling_benchmark:
+    print(benchmark_parallel_spi(da.transpose('time', 'lat', 'lon'), scale,
+                                 calibration_year_initial, calibration_year_final,
+                                 worker_counts=[1, 2, 4, os.cpu_count()], tile_size=tile_size))
 
 # Plot SPI for a specific year
 selected = da_spi.sel(time='2024')
@@ -34,132 +34,152 @@ import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 import pandas as pd
 import os
+import sys
+from anomaly_engine import compute_anomalies, wrap_longitude, update_anomalies
+from raster_export import to_spatial, write_time_series
+from map_renderer import render_figures, monthly_figure_jobs
+from zonal_stats import cached_coverage_weights, zonal_means
 
-# 1. Load temperature dataset
+sys.path.append(os.path.abspath(os.path.join('..', 'common')))
+from regions import load_regions
+
+# 1. Temperature dataset
 file_path = r"C:\Users\Downloads\air.mon.mean.nc" # Update with your local path
-ds = xr.open_dataset(file_path)
-
-# 2. Fix longitude format
-air = ds['air']  # in Kelvin
-air.coords['lon'] = (air.coords['lon'] + 180) % 360 - 180
-air = air.sortby('lon')
-
-# 3. Convert to Celsius
-air_c = air - 273.15
-
-# 4. Extract only 2024 data FIRST (to reduce memory usage)
-air_2024 = air_c.sel(time=air_c['time.year'] == 2024)
-
-# 5. Compute monthly climatology from 1971–2000
-climatology = air_c.sel(time=slice('1971', '2000')).groupby('time.month').mean('time')
-
-# 6. Compute anomaly for 2024 only
-anomaly2024 = air_2024.groupby('time.month') - climatology
-
-# 7. Set up the plot with EqualEarth projection
-projection = ccrs.EqualEarth()
-fig, axes = plt.subplots(6, 2, sharex=True, sharey=True,
-                         constrained_layout=True,
-                         subplot_kw={'projection': projection})
-fig.set_size_inches(11.7, 16.5)
-
-# 8. Loop through each month and plot
-for index, ax in enumerate(axes.flat):
-    if index < anomaly2024.sizes['time']:
-        data = anomaly2024.isel(time=index)
-        im = data.plot(
-            ax=ax,
-            transform=ccrs.PlateCarree(),
-            cmap='RdBu_r',
-            vmin=-5, vmax=5,
-            add_colorbar=False, add_labels=False
-        )
-        title = pd.to_datetime(data.time.values).strftime('%Y-%b')
-        ax.set_title(title, fontsize=9)
-        ax.set_aspect('auto')
-        ax.coastlines()
-        ax.gridlines(draw_labels=False)
-    else:
-        ax.set_visible(False)
-
-# 9. Add shared colorbar and title
-fig.colorbar(im, ax=axes[5, :2], shrink=0.4, pad=0.05, location='bottom',
-             label='Surface Air Temperature Anomaly (°C)')
-fig.suptitle('Global Surface Temperature Anomaly - 2024', fontsize=16)
-
-plt.show()
-
-
-#Set mapping to meditaranean
-# 10. Set up the plot with a regional-friendly projection
-projection = ccrs.Mercator()
-fig, axes = plt.subplots(6, 2, sharex=True, sharey=True,
-                         constrained_layout=True,
-                         subplot_kw={'projection': projection})
-fig.set_size_inches(11.7, 16.5)
-
-# 11. Loop through each month and plot
-for index, ax in enumerate(axes.flat):
-    if index < anomaly2024.sizes['time']:
-        data = anomaly2024.isel(time=index)
-        im = data.plot(
-            ax=ax,
-            transform=ccrs.PlateCarree(),
-            cmap='RdBu_r',               #  Better for temperature
-            vmin=-5, vmax=5,             #  °C anomaly range
-            add_colorbar=False,
-            add_labels=False
-        )
-        title = pd.to_datetime(data.time.values).strftime('%Y-%b')
-        ax.set_title(title, fontsize=9)
-        ax.set_aspect('auto')
-        ax.set_extent([-10, 35, 30, 50], crs=ccrs.PlateCarree())  #  Mediterranean focus
-        ax.coastlines()
-        ax.gridlines(draw_labels=False)
-    else:
-        ax.set_visible(False)
-
-# 12. Add shared colorbar and title
-fig.colorbar(im, ax=axes[5, :2], shrink=0.4, pad=0.05, location='bottom',
-             label='Surface Air Temperature Anomaly (°C)')
-fig.suptitle('Mediterranean Temperature Anomaly - 2024', fontsize=16)
-
-plt.show()
+
+# 2. Stream the file once in time chunks: 1971–2000 monthly climatology + 2024 anomaly
+#    (anomalies in Kelvin equal anomalies in °C, so no unit conversion is needed)
+#    Set region_bbox = MED_BBOX for Mediterranean-only products: only that lat/lon
+#    hyperslab is then read from disk (the 'global' figure then shows the region only)
+MED_BBOX = (-10, 30, 35, 50)   # minx, miny, maxx, maxy (clip, incremental update and maps)
+MED_EXTENT = (MED_BBOX[0], MED_BBOX[2], MED_BBOX[1], MED_BBOX[3])   # cartopy order
+region_bbox = None
+anomaly2024, climatology = compute_anomalies(file_path, 'air',
+                                             baseline=('1971', '2000'), years=[2024],
+                                             bbox=region_bbox)
+
+# 3. Fix longitude format (on the 2024 result only; a bbox read is already -180..180)
+if region_bbox is None:
+    anomaly2024 = wrap_longitude(anomaly2024)
+
+# 'batch' renders both figures headless (Agg) in a process pool and writes PNGs;
+# 'interactive' draws them one by one with plt.show()
+render_mode = 'batch'
+fig_dir = 'figures'
+# Pool workers re-import a script's __main__ module on Windows (spawn) and would re-run
+# this whole file, so render in parallel only from an interactive session (no __file__)
+render_workers = 1 if hasattr(sys.modules['__main__'], '__file__') else 2
+
+if render_mode == 'batch':
+    render_figures(monthly_figure_jobs(anomaly2024, 'temperature_anomaly', 2024,
+                                       label='Surface Air Temperature Anomaly (°C)',
+                                       cmap='RdBu_r', vmin=-5, vmax=5, out_dir=fig_dir,
+                                       med_extent=MED_EXTENT,
+                                       title_global='Global Surface Temperature Anomaly - 2024',
+                                       title_med='Mediterranean Temperature Anomaly - 2024'),
+                   n_workers=render_workers)
+else:
+    # 7. Set up the plot with EqualEarth projection
+    projection = ccrs.EqualEarth()
+    fig, axes = plt.subplots(6, 2, sharex=True, sharey=True,
+                             constrained_layout=True,
+                             subplot_kw={'projection': projection})
+    fig.set_size_inches(11.7, 16.5)
+
+    # 8. Loop through each month and plot
+    for index, ax in enumerate(axes.flat):
+        if index < anomaly2024.sizes['time']:
+            data = anomaly2024.isel(time=index)
+            im = data.plot(
+                ax=ax,
+                transform=ccrs.PlateCarree(),
+                cmap='RdBu_r',
+                vmin=-5, vmax=5,
+                add_colorbar=False, add_labels=False
+            )
+            title = pd.to_datetime(data.time.values).strftime('%Y-%b')
+            ax.set_title(title, fontsize=9)
+            ax.set_aspect('auto')
+            ax.coastlines()
+            ax.gridlines(draw_labels=False)
+        else:
+            ax.set_visible(False)
+
+    # 9. Add shared colorbar and title
+    fig.colorbar(im, ax=axes[5, :2], shrink=0.4, pad=0.05, location='bottom',
+                 label='Surface Air Temperature Anomaly (°C)')
+    fig.suptitle('Global Surface Temperature Anomaly - 2024', fontsize=16)
+
+    plt.show()
+
+
+    #Set mapping to meditaranean
+    # 10. Set up the plot with a regional-friendly projection
+    projection = ccrs.Mercator()
+    fig, axes = plt.subplots(6, 2, sharex=True, sharey=True,
+                             constrained_layout=True,
+                             subplot_kw={'projection': projection})
+    fig.set_size_inches(11.7, 16.5)
+
+    # 11. Loop through each month and plot
+    for index, ax in enumerate(axes.flat):
+        if index < anomaly2024.sizes['time']:
+            data = anomaly2024.isel(time=index)
+            im = data.plot(
+                ax=ax,
+                transform=ccrs.PlateCarree(),
+                cmap='RdBu_r',               #  Better for temperature
+                vmin=-5, vmax=5,             #  °C anomaly range
+                add_colorbar=False,
+                add_labels=False
+            )
+            title = pd.to_datetime(data.time.values).strftime('%Y-%b')
+            ax.set_title(title, fontsize=9)
+            ax.set_aspect('auto')
+            ax.set_extent(MED_EXTENT, crs=ccrs.PlateCarree())  #  Mediterranean focus
+            ax.coastlines()
+            ax.gridlines(draw_labels=False)
+        else:
+            ax.set_visible(False)
+
+    # 12. Add shared colorbar and title
+    fig.colorbar(im, ax=axes[5, :2], shrink=0.4, pad=0.05, location='bottom',
+                 label='Surface Air Temperature Anomaly (°C)')
+    fig.suptitle('Mediterranean Temperature Anomaly - 2024', fontsize=16)
+
+    plt.show()
 
 
 # %%
-out_dir = r"C:\Users\" # specify your output directory here
-da = anomaly2024.rename({'lon': 'x', 'lat': 'y'})
-# 2. Set spatial dimensions
-da = da.rio.set_spatial_dims(x_dim='x', y_dim='y')
-# 3. Assign CRS (WGS84)
-da= da.rio.write_crs("EPSG:4326", inplace=True)  # set CRS (WGS84)
-# 4. reduce dtype for smaller files
-da = da.astype('float32')
-
-# 5. write compressed multi-band GTiff (time->bands)
-# for i in range(da.sizes['time']):
-#     arr = da.isel(time=i)
-#     date_str = pd.to_datetime(arr.time.values).strftime("%Y-%m")
-#     out_file = os.path.join(out_dir, f"anomaly_{date_str}.tif")
-#     arr.rio.to_raster(out_file, driver="GTiff", compress="LZW", tiled=True)
-#     print("Wrote:", out_file)
+out_dir = r"C:\Users" # specify your output directory here
+# 'tif' writes the whole year as one tiled multi-band COG (band descriptions = month),
+# 'nc' / 'zarr' keep the time dimension, 'per_month' writes one GeoTIFF per month
+export_format = 'tif'
+
+# 2-4. x/y spatial dims, CRS (WGS84) and float32 for smaller files
+da = to_spatial(anomaly2024)
+
+# 5. write the global anomaly (time->bands)
+# out_file = os.path.join(out_dir, f"temperature_anomaly_2024.{export_format}")
+# write_time_series(da, out_file)
+# print("Wrote:", out_file)
 
 #%% If you want to save the data only for the Mediterranean region
 # 6. Clip to boundary 
 
 # Clip to bounding box: [min_lon, min_lat, max_lon, max_lat]
-da = da.rio.clip_box(minx=-10, miny=35, maxx=30, maxy=50)
-
-# Reduce dtype
-da = da.astype('float32')
-
-# Save each time slice as compressed GeoTIFF
-for i in range(da.sizes['time']):
-    arr = da.isel(time=i)
-    date_str = pd.to_datetime(arr.time.values).strftime("%Y-%m")
-    out_file = os.path.join(out_dir, f"temperature_anomaly_MED_{date_str}.tif")
-    arr.rio.to_raster(out_file, driver="GTiff", compress="LZW", tiled=True)
+da = da.rio.clip_box(*MED_BBOX)
+
+if export_format == 'per_month':
+    # Save each time slice as compressed GeoTIFF
+    for i in range(da.sizes['time']):
+        arr = da.isel(time=i)
+        date_str = pd.to_datetime(arr.time.values).strftime("%Y-%m")
+        out_file = os.path.join(out_dir, f"temperature_anomaly_MED_{date_str}.tif")
+        arr.rio.to_raster(out_file, driver="GTiff", compress="LZW", tiled=True)
+        print("Wrote:", out_file)
+else:
+    out_file = os.path.join(out_dir, f"temperature_anomaly_MED_2024.{export_format}")
+    write_time_series(da, out_file)
     print("Wrote:", out_file)
 
 # if you have a shapefile boundary, you can use:
@@ -168,4 +188,32 @@ for i in range(da.sizes['time']):
 # da = da.rio.clip(boundary.geometry, boundary.crs)
 
 
+# %%
+# Area-weighted anomaly per case-study region (Demo Boundaries) for every month:
+# cell coverage fraction x cell area weights, cached per grid/region pair
+regions = load_regions().frame()
+weights = cached_coverage_weights(anomaly2024, regions)
+regional_anomaly = zonal_means(anomaly2024, weights)
+print(regional_anomaly.round(2))
+regional_anomaly.to_csv(os.path.join(out_dir, "temperature_anomaly_regions_2024.csv"))
+
+# %%
+# Incremental monthly update: when NOAA appends a month to the file, only the
+# Mediterranean hyperslab of the new month(s) is read and exported. The 1971–2000
+# climatology is computed once and cached in data/climatology_cache (keyed by
+# dataset, variable, baseline, grid and bbox); the last exported month is tracked
+# in the state file. Updates get their own file names so that they never
+# overwrite the batch export above.
+def export_month(da_month):
+    da_month = to_spatial(da_month)
+    date_str = pd.to_datetime(da_month.time.values[0]).strftime("%Y-%m")
+    out_file = os.path.join(out_dir, f"temperature_anomaly_MED_update_{date_str}.tif")
+    write_time_series(da_month, out_file)
+    print("Wrote:", out_file)
+
+new_months = update_anomalies(file_path, 'air', export_month,
+                              state_file=os.path.join(out_dir, "temperature_anomaly_MED_state.json"),
+                              baseline=('1971', '2000'), first_year=2024,
+                              bbox=MED_BBOX)
+
 # %%
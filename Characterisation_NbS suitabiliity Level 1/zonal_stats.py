@@ -0,0 +1,131 @@
+"""
+Area-weighted zonal statistics of gridded anomalies for the case-study regions.
+
+The anomaly grids (NCEP 2.5°, CPC 0.5°) are much coarser than the regions in
+`Demo Boundaries/`, so every grid cell gets a weight equal to the fraction of
+the cell covered by the region times the cell's area on the sphere (which
+scales with cos(latitude)). The weights of all regions form one sparse
+(regions x cells) matrix, computed once per grid/region pair and cached on
+disk; the regional means for every month are then one sparse matrix-cube
+product.
+
+Example
+-------
+    from regions import load_regions                  # common/regions.py
+    from zonal_stats import cached_coverage_weights, zonal_means
+
+    regions = load_regions().frame()
+    weights = cached_coverage_weights(anomaly2024, regions)
+    regional = zonal_means(anomaly2024, weights)     # DataFrame: time x region
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def cell_edges(centers):
+    """Cell edges from (regularly or irregularly spaced) cell centres."""
+    centers = np.asarray(centers, dtype='float64')
+    mid = (centers[:-1] + centers[1:]) / 2
+    first = centers[0] - (mid[0] - centers[0])
+    last = centers[-1] + (centers[-1] - mid[-1])
+    return np.concatenate([[first], mid, [last]])
+
+
+def cell_areas_km2(lat, lon):
+    """Spherical area of every (lat, lon) cell, shape (n_lat, n_lon)."""
+    lat_e = np.radians(np.clip(cell_edges(lat), -90, 90))
+    lon_e = np.radians(cell_edges(lon))
+    band = np.abs(np.sin(lat_e[1:]) - np.sin(lat_e[:-1]))
+    width = np.abs(lon_e[1:] - lon_e[:-1])
+    return EARTH_RADIUS_KM ** 2 * np.outer(band, width)
+
+
+def coverage_weights(lat, lon, regions, name_col='region'):
+    """
+    Sparse (regions x cells) matrix of covered fraction x cell area, cells in row-major (lat, lon) order.
+
+    Longitudes may be 0..360 or -180..180; cells are matched to the regions in
+    -180..180. Returns (weights, region_names).
+    """
+    lat, lon = np.asarray(lat), np.asarray(lon)
+    lat_e, lon_e = cell_edges(lat), cell_edges(lon)
+    lon_e = (lon_e + 180) % 360 - 180
+    areas = cell_areas_km2(lat, lon)
+    n_lon = lon.size
+
+    lat_lo, lat_hi = np.minimum(lat_e[:-1], lat_e[1:]), np.maximum(lat_e[:-1], lat_e[1:])
+    lon_lo, lon_hi = lon_e[:-1], np.where(lon_e[1:] < lon_e[:-1], lon_e[1:] + 360, lon_e[1:])
+
+    rows, cols, vals = [], [], []
+    for r, geom in enumerate(regions.to_crs("EPSG:4326").geometry):
+        minx, miny, maxx, maxy = geom.bounds
+        iy = np.flatnonzero((lat_hi > miny) & (lat_lo < maxy))
+        ix = np.flatnonzero((lon_hi > minx) & (lon_lo < maxx))
+        if iy.size == 0 or ix.size == 0:
+            continue
+        yy, xx = np.meshgrid(iy, ix, indexing='ij')
+        yy, xx = yy.ravel(), xx.ravel()
+        boxes = shapely.box(lon_lo[xx], lat_lo[yy], lon_hi[xx], lat_hi[yy])
+        fraction = shapely.area(shapely.intersection(boxes, geom)) / shapely.area(boxes)
+        keep = fraction > 0
+        rows.append(np.full(keep.sum(), r))
+        cols.append(yy[keep] * n_lon + xx[keep])
+        vals.append(fraction[keep] * areas[yy[keep], xx[keep]])
+
+    shape = (len(regions), lat.size * lon.size)
+    if not rows:
+        return sparse.csr_matrix(shape), list(regions[name_col])
+    weights = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                shape=shape)
+    return weights, list(regions[name_col])
+
+
+def _weights_key(lat, lon, regions, name_col):
+    h = hashlib.sha1()
+    h.update(np.asarray(lat, 'float64').tobytes())
+    h.update(np.asarray(lon, 'float64').tobytes())
+    for name, geom in zip(regions[name_col], regions.to_crs("EPSG:4326").geometry):
+        h.update(str(name).encode('utf-8'))
+        h.update(shapely.to_wkb(geom))
+    return h.hexdigest()[:16]
+
+
+def cached_coverage_weights(da, regions, name_col='region', cache_dir=os.path.join('data', 'zonal_weights'),
+                            lat='lat', lon='lon'):
+    """coverage_weights() for the grid of `da`, cached on disk per grid/region pair."""
+    os.makedirs(cache_dir, exist_ok=True)
+    lat_v, lon_v = da[lat].values, da[lon].values
+    path = os.path.join(cache_dir, f"weights_{_weights_key(lat_v, lon_v, regions, name_col)}.npz")
+    if os.path.exists(path):
+        with np.load(path, allow_pickle=False) as f:
+            weights = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+            return weights, list(f['names'])
+    weights, names = coverage_weights(lat_v, lon_v, regions, name_col)
+    np.savez(path, data=weights.data, indices=weights.indices, indptr=weights.indptr,
+             shape=np.array(weights.shape), names=np.array(names))
+    return weights, names
+
+
+def zonal_means(da, weights, lat='lat', lon='lon', time_dim='time'):
+    """
+    Area-weighted regional means of `da` for every time step, as a (time x region) DataFrame.
+
+    Missing cells are left out of both the weighted sum and the weight total.
+    """
+    weights, names = weights
+    da = da.transpose(time_dim, lat, lon)
+    values = da.values.reshape(da.sizes[time_dim], -1).T      # (cells, time)
+    valid = np.isfinite(values)
+    total = weights @ np.where(valid, values, 0.0)
+    norm = weights @ valid.astype('float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(norm > 0, total / norm, np.nan)
+    return pd.DataFrame(means.T, index=pd.DatetimeIndex(da[time_dim].values, name=time_dim),
+                        columns=pd.Index(names, name='region'))
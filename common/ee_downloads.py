@@ -0,0 +1,222 @@
+"""
+Concurrent, retrying download manager for Earth Engine `getDownloadURL` exports.
+
+All region exports are submitted at once to a bounded thread pool. Each job
+resolves its URL inside the worker (getDownloadURL is itself a blocking call),
+streams the response to `<path>.part` and renames it when complete, so an
+interrupted download never leaves a truncated GeoTIFF behind. Transient errors
+(HTTP 429/5xx, connection resets, timeouts, EE "too many requests" and
+per-minute quotas) are retried with exponential backoff and jitter; other
+errors, including an exhausted daily or storage quota, fail the job without
+stopping the rest. Per-job latency, attempts and bytes are returned as a DataFrame.
+
+A job is a dict with `name`, `path` and `url` (a string or a function returning
+one). local_server() serves a folder over HTTP, optionally failing the first
+requests, so the concurrency and retry paths can be exercised offline:
+
+    python ee_downloads.py --jobs 16 --workers 4 --fail-first 2
+
+Example
+-------
+    from ee_downloads import download_all
+
+    jobs = [dict(name=region, path=tif_path,
+                 url=lambda image=image, bbox=bbox: image.getDownloadURL(
+                     {'scale': 30, 'region': bbox, 'format': 'GEO_TIFF'}))
+            for region, image, bbox, tif_path in exports]
+    stats = download_all(jobs, max_workers=4)
+"""
+import argparse
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+import pandas as pd
+
+TRANSIENT_HTTP_CODES = {408, 425, 429, 500, 502, 503, 504}
+TRANSIENT_MESSAGES = ('too many requests', 'too many concurrent', 'rate limit', 'timed out',
+                      'temporarily', 'try again', 'connection reset', 'quota')
+# Per-minute / concurrency quotas recover within the backoff window; an exhausted
+# daily or storage quota does not, so those fail straight away
+PERMANENT_QUOTA_MESSAGES = ('per day', 'daily', 'storage')
+
+
+def is_transient(exc):
+    """True for errors worth retrying (throttling, server errors, network hiccups)."""
+    if isinstance(exc, HTTPError):
+        return exc.code in TRANSIENT_HTTP_CODES
+    if isinstance(exc, (URLError, ConnectionError, TimeoutError, socket.timeout)):
+        return True
+    message = str(exc).lower()
+    if 'quota' in message and any(m in message for m in PERMANENT_QUOTA_MESSAGES):
+        return False
+    return any(m in message for m in TRANSIENT_MESSAGES)
+
+
+class RateLimiter:
+    """Spaces out request starts to at most `rate` per second across threads."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+def stream_to_file(url, path, timeout=300, chunk_size=1 << 20):
+    """Stream `url` to `path` through a temporary `.part` file. Returns the number of bytes."""
+    tmp_path = path + '.part'
+    n_bytes = 0
+    with urlopen(url, timeout=timeout) as response, open(tmp_path, 'wb') as f:
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            n_bytes += len(chunk)
+    os.replace(tmp_path, path)
+    return n_bytes
+
+
+def download_job(job, retries=4, backoff=2.0, max_backoff=60.0, timeout=300, limiter=None):
+    """Run one job with retries; never raises. Returns a stats dict."""
+    stats = {'name': job['name'], 'path': job['path'], 'status': 'failed', 'attempts': 0,
+             'bytes': 0, 'seconds': 0.0, 'error': None}
+    if os.path.exists(job['path']) and not job.get('overwrite', False):
+        stats.update(status='cached', bytes=os.path.getsize(job['path']))
+        return stats
+
+    start = time.perf_counter()
+    for attempt in range(1, retries + 2):
+        stats['attempts'] = attempt
+        try:
+            if limiter is not None:
+                limiter.wait()
+            url = job['url']() if callable(job['url']) else job['url']
+            stats['bytes'] = stream_to_file(url, job['path'], timeout)
+            stats.update(status='ok', error=None)
+            break
+        except Exception as e:
+            stats['error'] = f"{type(e).__name__}: {e}"
+            if os.path.exists(job['path'] + '.part'):
+                os.remove(job['path'] + '.part')
+            if attempt > retries or not is_transient(e):
+                break
+            delay = min(max_backoff, backoff * 2 ** (attempt - 1))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def download_all(jobs, max_workers=4, rate=None, retries=4, backoff=2.0, timeout=300,
+                 verbose=True):
+    """
+    Download all jobs concurrently with at most `max_workers` in flight and `rate` starts/s.
+
+    Returns a DataFrame with one row per job (status ok/cached/failed, attempts,
+    bytes, seconds, error), in the order of `jobs`.
+    """
+    for job in jobs:
+        os.makedirs(os.path.dirname(os.path.abspath(job['path'])), exist_ok=True)
+    limiter = RateLimiter(rate)
+    run = partial(download_job, retries=retries, backoff=backoff, timeout=timeout,
+                  limiter=limiter)
+    results = [None] * len(jobs)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            stats = future.result()
+            results[futures[future]] = stats
+            if verbose:
+                extra = f" ({stats['error']})" if stats['status'] == 'failed' else ''
+                print(f" {stats['name']}: {stats['status']}, {stats['bytes'] / 1e6:.1f} MB, "
+                      f"{stats['seconds']:.1f} s, {stats['attempts']} attempt(s){extra}")
+    table = pd.DataFrame(results, columns=['name', 'path', 'status', 'attempts', 'bytes',
+                                           'seconds', 'error'])
+    if verbose:
+        done = table[table['status'] == 'ok']
+        print(f"{len(done)} downloaded, {(table['status'] == 'cached').sum()} cached, "
+              f"{(table['status'] == 'failed').sum()} failed; "
+              f"{done['bytes'].sum() / 1e6:.1f} MB in {time.perf_counter() - start:.1f} s")
+    return table
+
+
+class _FlakyHandler(SimpleHTTPRequestHandler):
+    """Static file handler that answers 503 to the first `fail_first` requests of every path."""
+    fail_first = 0
+    delay = 0.0
+    counts = None
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.counts[self.path] = self.counts.get(self.path, 0) + 1
+            n = self.counts[self.path]
+        if self.delay:
+            time.sleep(self.delay)
+        if n <= self.fail_first:
+            self.send_error(503, "Service temporarily unavailable")
+            return
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def local_server(directory, fail_first=0, delay=0.0):
+    """
+    Serve `directory` over HTTP on localhost in a background thread; yields the base URL.
+
+    Stands in for the Earth Engine download endpoint: every path fails with 503
+    for its first `fail_first` requests and each response waits `delay` seconds.
+    """
+    handler = type('Handler', (_FlakyHandler,),
+                   {'fail_first': fail_first, 'delay': delay, 'counts': {}})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(handler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline check of the download manager "
+                                                 "against a local flaky HTTP server.")
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--size-mb', type=float, default=2.0)
+    parser.add_argument('--fail-first', type=int, default=2)
+    parser.add_argument('--delay', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as dst:
+        for i in range(args.jobs):
+            with open(os.path.join(src, f"region_{i}.tif"), 'wb') as f:
+                f.write(os.urandom(int(args.size_mb * 1e6)))
+        with local_server(src, fail_first=args.fail_first, delay=args.delay) as base_url:
+            jobs = [dict(name=f"region_{i}", url=f"{base_url}/region_{i}.tif",
+                         path=os.path.join(dst, f"region_{i}.tif")) for i in range(args.jobs)]
+            table = download_all(jobs, max_workers=args.workers, backoff=0.1)
+        print(table[['name', 'status', 'attempts', 'bytes', 'seconds']].to_string(index=False))
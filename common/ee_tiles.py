@@ -0,0 +1,155 @@
+"""
+Tiled Earth Engine exports for regions too large for one `getDownloadURL` request.
+
+Direct downloads are capped at about 48 MB per request (and 32768 pixels per
+side). tile_grid() lays a pixel-aligned EPSG:4326 grid over the region bbox at
+the requested scale and splits it into tiles that each stay under `max_bytes`.
+Every tile is requested with the same crs_transform origin, so the tiles fit
+together exactly. The tiles are downloaded in parallel with ee_downloads and
+stitched by build_vrt() into a VRT (an XML index of the tiles, no pixels are
+copied); vrt_to_cog() then streams the VRT block by block into one COG, so
+the full mosaic is never held in memory.
+
+Example
+-------
+    from ee_tiles import tiled_jobs, mosaic_tiles
+    from ee_downloads import download_all
+
+    jobs = tiled_jobs(image, gdf.to_crs("EPSG:4326").total_bounds, scale=30,
+                      name='Sardegna_epoch', out_dir='ghs_epoch_rasters/tiles')
+    stats = download_all(jobs, max_workers=4)
+    mosaic_tiles(list(stats['path']), 'ghs_epoch_rasters/Sardegna_epoch.tif')
+"""
+import math
+import os
+from xml.sax.saxutils import escape
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+
+EE_MAX_REQUEST_BYTES = 48 * 1024 ** 2
+EE_MAX_DIMENSION = 32768
+METERS_PER_DEGREE = 111320.0
+
+
+def pixel_size_degrees(scale, lat):
+    """Approximate (dx, dy) in degrees of a `scale`-metre pixel at latitude `lat`."""
+    dy = scale / METERS_PER_DEGREE
+    dx = dy / max(math.cos(math.radians(lat)), 0.01)
+    return dx, dy
+
+
+def tile_grid(bounds, scale, max_bytes=32e6, bytes_per_pixel=8, n_bands=1):
+    """
+    Pixel-aligned tiles covering `bounds` (minx, miny, maxx, maxy in degrees) at `scale` metres.
+
+    Each tile holds at most `max_bytes` of uncompressed pixels (kept below the EE
+    limit to leave room for the GeoTIFF overhead). Returns a list of dicts with
+    row, col, width, height and the EE crs_transform of the tile.
+    """
+    minx, miny, maxx, maxy = [float(b) for b in bounds]
+    dx, dy = pixel_size_degrees(scale, (miny + maxy) / 2)
+    width = max(1, math.ceil((maxx - minx) / dx))
+    height = max(1, math.ceil((maxy - miny) / dy))
+
+    max_pixels = max_bytes / (bytes_per_pixel * n_bands)
+    side = int(min(math.isqrt(int(max_pixels)), EE_MAX_DIMENSION))
+    n_cols, n_rows = math.ceil(width / side), math.ceil(height / side)
+    tile_w, tile_h = math.ceil(width / n_cols), math.ceil(height / n_rows)
+
+    tiles = []
+    for row in range(n_rows):
+        for col in range(n_cols):
+            x0, y0 = col * tile_w, row * tile_h
+            w, h = min(tile_w, width - x0), min(tile_h, height - y0)
+            tiles.append({'row': row, 'col': col, 'width': w, 'height': h,
+                          'crs_transform': [dx, 0, minx + x0 * dx, 0, -dy, maxy - y0 * dy]})
+    return tiles
+
+
+def tiled_jobs(image, bounds, scale, name, out_dir, max_bytes=32e6, bytes_per_pixel=8,
+               n_bands=1):
+    """ee_downloads jobs for the tiles of `image` over `bounds` (URLs resolved lazily)."""
+    jobs = []
+    for tile in tile_grid(bounds, scale, max_bytes, bytes_per_pixel, n_bands):
+        params = {'crs': 'EPSG:4326', 'crs_transform': tile['crs_transform'],
+                  'dimensions': f"{tile['width']}x{tile['height']}", 'format': 'GEO_TIFF'}
+        jobs.append(dict(name=f"{name}_r{tile['row']:02d}_c{tile['col']:02d}",
+                         path=os.path.join(out_dir, f"{name}_r{tile['row']:02d}_c{tile['col']:02d}.tif"),
+                         url=lambda image=image, params=params: image.getDownloadURL(params)))
+    return jobs
+
+
+def build_vrt(tile_paths, vrt_path):
+    """
+    Write a VRT mosaic of pixel-aligned GeoTIFF tiles (same CRS, resolution and bands).
+
+    Only the tile headers are read.
+    """
+    metas = []
+    for path in tile_paths:
+        with rasterio.open(path) as src:
+            metas.append((path, src.transform, src.width, src.height, src.count,
+                          src.dtypes[0], src.nodata, src.crs, src.block_shapes[0]))
+    _, t0, _, _, count, dtype, nodata, crs, _ = metas[0]
+    dx, dy = t0.a, t0.e
+    left = min(m[1].c for m in metas)
+    top = max(m[1].f for m in metas)
+    right = max(m[1].c + m[2] * dx for m in metas)
+    bottom = min(m[1].f + m[3] * dy for m in metas)
+    width, height = int(round((right - left) / dx)), int(round((bottom - top) / dy))
+
+    vrt_type = {'uint8': 'Byte', 'int8': 'Int8', 'uint16': 'UInt16', 'int16': 'Int16',
+                'uint32': 'UInt32', 'int32': 'Int32', 'float32': 'Float32',
+                'float64': 'Float64'}[dtype]
+    vrt_dir = os.path.dirname(os.path.abspath(vrt_path))
+    lines = [f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">',
+             f'  <SRS>{escape(crs.to_wkt())}</SRS>',
+             f'  <GeoTransform>{left!r}, {dx!r}, 0.0, {top!r}, 0.0, {dy!r}</GeoTransform>']
+    for band in range(1, count + 1):
+        lines.append(f'  <VRTRasterBand dataType="{vrt_type}" band="{band}">')
+        if nodata is not None and not np.isnan(nodata):
+            lines.append(f'    <NoDataValue>{nodata!r}</NoDataValue>')
+        for path, t, w, h, _, _, _, _, (block_h, block_w) in metas:
+            x_off, y_off = int(round((t.c - left) / dx)), int(round((t.f - top) / dy))
+            rel = os.path.relpath(os.path.abspath(path), vrt_dir)
+            lines += ['    <SimpleSource>',
+                      f'      <SourceFilename relativeToVRT="1">{escape(rel)}</SourceFilename>',
+                      f'      <SourceBand>{band}</SourceBand>',
+                      f'      <SourceProperties RasterXSize="{w}" RasterYSize="{h}" '
+                      f'DataType="{vrt_type}" BlockXSize="{block_w}" BlockYSize="{block_h}"/>',
+                      f'      <SrcRect xOff="0" yOff="0" xSize="{w}" ySize="{h}"/>',
+                      f'      <DstRect xOff="{x_off}" yOff="{y_off}" xSize="{w}" ySize="{h}"/>',
+                      '    </SimpleSource>']
+        lines.append('  </VRTRasterBand>')
+    lines.append('</VRTDataset>')
+    with open(vrt_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return vrt_path
+
+
+def vrt_to_cog(vrt_path, out_path, compress='DEFLATE', num_threads='ALL_CPUS'):
+    """Stream a VRT into a tiled COG with overviews (GDAL copies it block by block)."""
+    rasterio.shutil.copy(vrt_path, out_path, driver='COG', compress=compress,
+                         num_threads=str(num_threads), overviews='AUTO', BIGTIFF='IF_SAFER')
+    return out_path
+
+
+def mosaic_tiles(tile_paths, out_path, cog=True, keep_tiles=False):
+    """
+    Mosaic downloaded tiles into `out_path`: a .vrt next to it and, if `cog`, a COG.
+
+    Once the COG is written the VRT and (unless `keep_tiles`) the tiles are
+    deleted. Returns the path of the COG (or of the VRT when cog=False).
+    """
+    vrt_path = os.path.splitext(out_path)[0] + '.vrt'
+    build_vrt(tile_paths, vrt_path)
+    if not cog:
+        return vrt_path
+    vrt_to_cog(vrt_path, out_path)
+    os.remove(vrt_path)
+    if not keep_tiles:
+        for path in tile_paths:
+            os.remove(path)
+    return out_path
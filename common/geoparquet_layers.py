@@ -0,0 +1,124 @@
+"""
+GeoParquet copies of the large vector layers (GRIP4 roads, Natura 2000) with bbox pushdown.
+
+`convert_to_geoparquet` is the one-time conversion: the shapefile is read
+through pyogrio/Arrow, its features are sorted along a Hilbert curve (so that
+neighbouring features end up in the same row groups) and written as GeoParquet
+1.1 with a `bbox` covering column and row-group statistics. A bbox read then
+only decodes the row groups whose bbox statistics overlap the query, instead
+of scanning every feature of the shapefile through fiona.
+
+`read_layer` reads either format: GeoParquet through the bbox pushdown
+(attributes as Arrow-backed pandas columns), anything else through pyogrio's
+bbox filter. `ensure_geoparquet` converts on first use and returns the cached
+copy afterwards (reconverting when the source is newer).
+
+Example
+-------
+    from geoparquet_layers import ensure_geoparquet, read_layer
+
+    natura_parquet = ensure_geoparquet(natura_path)         # ../data/geoparquet/<name>.parquet
+    natura_gdf = read_layer(natura_parquet, bbox=regions.bounds(region))
+
+    # or once, from the command line:
+    python geoparquet_layers.py GRIP4_region4.shp Natura2000_end2023_epsg4326.shp
+"""
+import argparse
+import json
+import os
+import time
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow.parquet as pq
+import pyogrio
+from pyproj import CRS
+
+GEOPARQUET_DIR = os.path.join('..', 'data', 'geoparquet')
+
+
+def geoparquet_path(src_path, out_dir=GEOPARQUET_DIR):
+    """GeoParquet location of the vector file `src_path`."""
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(src_path))[0] + '.parquet')
+
+
+def convert_to_geoparquet(src_path, out_path=None, columns=None, row_group_size=20000, level=16):
+    """
+    Write `src_path` (any OGR vector file) as Hilbert-sorted GeoParquet with a bbox covering column.
+
+    Features without geometry are dropped. `row_group_size` trades read granularity
+    against file overhead; `level` is the Hilbert curve order. Returns the output path.
+    """
+    out_path = out_path or geoparquet_path(src_path)
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    start = time.time()
+    gdf = pyogrio.read_dataframe(src_path, columns=columns, use_arrow=True)
+    gdf = gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)]
+    order = gdf.geometry.hilbert_distance(total_bounds=gdf.total_bounds, level=level).argsort()
+    gdf = gdf.iloc[order.values].reset_index(drop=True)
+
+    tmp_path = out_path + '.part'
+    gdf.to_parquet(tmp_path, schema_version='1.1.0', write_covering_bbox=True,
+                   row_group_size=row_group_size, write_statistics=True, compression='zstd')
+    os.replace(tmp_path, out_path)
+    print(f" {os.path.basename(src_path)} -> {out_path}: {len(gdf)} features, "
+          f"{pq.ParquetFile(out_path).num_row_groups} row groups, {time.time() - start:.1f} s")
+    return out_path
+
+
+def ensure_geoparquet(src_path, out_dir=GEOPARQUET_DIR, **kwargs):
+    """GeoParquet copy of `src_path`, converted first if missing or older than the source."""
+    out_path = geoparquet_path(src_path, out_dir)
+    if not os.path.exists(out_path) or os.path.getmtime(out_path) < os.path.getmtime(src_path):
+        convert_to_geoparquet(src_path, out_path, **kwargs)
+    return out_path
+
+
+def is_geoparquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.geoparquet')
+
+
+def layer_crs(path):
+    """CRS of a GeoParquet or OGR vector file, without reading its features."""
+    if not is_geoparquet(path):
+        return pyogrio.read_info(path)['crs']
+    geo = json.loads(pq.read_schema(path).metadata[b'geo'])
+    crs = geo['columns'][geo['primary_column']].get('crs', 'OGC:CRS84')
+    return CRS.from_user_input(crs)
+
+
+def read_geoparquet(path, bbox=None, columns=None, arrow_dtypes=True):
+    """
+    Features of a GeoParquet file intersecting `bbox` (minx, miny, maxx, maxy, in the file's CRS).
+
+    The bbox is pushed down to the row-group statistics of the covering column, so
+    only overlapping row groups are read. Attributes are Arrow-backed unless
+    `arrow_dtypes` is False; the covering column itself is dropped.
+    """
+    if columns is not None:
+        geo = json.loads(pq.read_schema(path).metadata[b'geo'])
+        columns = list(columns) + [geo['primary_column']]
+    gdf = gpd.read_parquet(path, bbox=None if bbox is None else tuple(bbox), columns=columns,
+                           to_pandas_kwargs={'types_mapper': pd.ArrowDtype} if arrow_dtypes else None)
+    return gdf.drop(columns='bbox', errors='ignore')
+
+
+def read_layer(path, bbox=None, columns=None):
+    """Features intersecting `bbox` from a GeoParquet file (pushdown) or any OGR file (pyogrio)."""
+    if is_geoparquet(path):
+        gdf = read_geoparquet(path, bbox, columns)
+    else:
+        gdf = pyogrio.read_dataframe(path, bbox=None if bbox is None else tuple(bbox),
+                                     columns=None if columns is None else list(columns),
+                                     use_arrow=True)
+    return gdf[~(gdf.geometry.isna() | gdf.geometry.is_empty)].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert vector layers to Hilbert-sorted GeoParquet.")
+    parser.add_argument('sources', nargs='+', help="shapefiles / GeoPackages to convert")
+    parser.add_argument('--out-dir', default=GEOPARQUET_DIR)
+    parser.add_argument('--row-group-size', type=int, default=20000)
+    args = parser.parse_args()
+    for src in args.sources:
+        convert_to_geoparquet(src, geoparquet_path(src, args.out_dir), row_group_size=args.row_group_size)
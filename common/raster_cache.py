@@ -0,0 +1,154 @@
+"""
+Content-addressed cache for downloaded / derived rasters, shared by the level-2 and level-3 scripts.
+
+A raster is stored under the hash of everything that determines its pixels
+(asset id, band, reducer, scale, CRS, region geometry, ...), so changing any
+of them is a cache miss instead of silently reusing a stale file named
+`{region}_epoch.tif`. A JSON index keeps size, creation and last-access time
+and hit count of every entry; when the cache exceeds its disk budget the least
+recently used entries are deleted. Hit/miss/eviction counts are kept per
+session.
+
+Example
+-------
+    from raster_cache import RasterCache, geometry_digest
+
+    cache = RasterCache(max_bytes=10e9)
+    params = dict(asset=asset_path, band='epoch', reducer='first', scale=30,
+                  crs='EPSG:4326', region=geometry_digest(gdf.geometry.union_all()))
+    tif_path = cache.get(params)
+    if tif_path is None:
+        tif_path = cache.path(params)       # download / write the raster here
+        ...
+        cache.add(params)
+    print(cache.stats())
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join('..', 'data', 'raster_cache')
+
+
+def geometry_digest(geom, precision=1e-7):
+    """Stable hash of a shapely geometry (normalized, coordinates rounded to `precision`)."""
+    import shapely
+
+    geom = shapely.normalize(shapely.set_precision(geom, precision))
+    return hashlib.sha1(shapely.to_wkb(geom, hex=False)).hexdigest()[:16]
+
+
+def params_key(params):
+    """Hash of a dict of raster parameters (order-independent)."""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class RasterCache:
+    """Disk cache of raster files keyed by their parameters, with an LRU size budget."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=20e9, ext='.tif'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ext = ext
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'added': 0, 'evicted': 0, 'evicted_bytes': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # -- index ---------------------------------------------------------------
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _save(self, index):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    # -- entries -------------------------------------------------------------
+    def key(self, params):
+        """Cache key of `params` (also usable to name per-entry work directories)."""
+        return params_key(params)
+
+    def path(self, params):
+        """Location of the raster for `params` (write misses here, then call add())."""
+        key = params_key(params)
+        os.makedirs(os.path.join(self.cache_dir, key[:2]), exist_ok=True)
+        return os.path.join(self.cache_dir, key[:2], key + self.ext)
+
+    def get(self, params):
+        """Path of the cached raster for `params`, or None on a miss."""
+        key = params_key(params)
+        path = self.path(params)
+        with self.lock:
+            index = self._load()
+            entry = index.get(key)
+            if entry is None or not os.path.exists(path):
+                index.pop(key, None)
+                self._save(index)
+                self.counts['misses'] += 1
+                return None
+            entry['last_access'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._save(index)
+            self.counts['hits'] += 1
+        return path
+
+    def add(self, params, src_path=None):
+        """
+        Register the raster for `params` (moved from `src_path` if given) and enforce the budget.
+
+        Returns the cached path.
+        """
+        key = params_key(params)
+        path = self.path(params)
+        if src_path is not None and os.path.abspath(src_path) != os.path.abspath(path):
+            shutil.move(src_path, path)
+        now = time.time()
+        with self.lock:
+            index = self._load()
+            index[key] = {'file': os.path.relpath(path, self.cache_dir),
+                          'bytes': os.path.getsize(path), 'created': now,
+                          'last_access': now, 'hits': 0, 'params': params}
+            self.counts['added'] += 1
+            self._evict(index, keep=key)
+            self._save(index)
+        return path
+
+    def _evict(self, index, keep=None):
+        total = sum(e['bytes'] for e in index.values())
+        for key, entry in sorted(index.items(), key=lambda kv: kv[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            path = os.path.join(self.cache_dir, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            total -= entry['bytes']
+            self.counts['evicted'] += 1
+            self.counts['evicted_bytes'] += entry['bytes']
+            del index[key]
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits `max_bytes`."""
+        with self.lock:
+            index = self._load()
+            self._evict(index)
+            self._save(index)
+
+    def stats(self):
+        """Session hit/miss/eviction counts plus current size and number of entries."""
+        with self.lock:
+            index = self._load()
+        lookups = self.counts['hits'] + self.counts['misses']
+        return dict(self.counts, entries=len(index),
+                    bytes=sum(e['bytes'] for e in index.values()),
+                    hit_rate=round(self.counts['hits'] / lookups, 3) if lookups else None)
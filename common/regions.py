@@ -0,0 +1,156 @@
+"""
+Shared registry of the case-study regions in `Demo Boundaries/`.
+
+All `<country>/<region>.shp` boundaries are read once (with the UTF-8 /
+ISO-8859-1 encoding fallback), dissolved to one geometry per region and stored
+in a GeoParquet cache together with their EPSG:4326 and EPSG:3035 versions,
+simplified variants, bounds and area. The cache is keyed by the names, sizes
+and modification times of the boundary files, so adding or editing a region
+rebuilds it; otherwise every script just reads one small Parquet file.
+Prepared geometries (fast repeated intersects/contains) are built on first
+use and kept in memory.
+
+Example
+-------
+    from regions import load_regions
+
+    regions = load_regions()                      # reads ../Demo Boundaries
+    for info in regions:                          # {'region': ..., 'country': ...}
+        gdf = regions.gdf(info['region'])          # one-row GeoDataFrame, EPSG:4326
+        gdf_3035 = regions.gdf(info['region'], crs="EPSG:3035")
+    all_3035 = regions.frame("EPSG:3035", simplified=True)
+"""
+import glob
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+import shapely
+
+DEMO_BOUNDARIES = os.path.join('..', 'Demo Boundaries')
+REGION_CACHE_DIR = os.path.join('..', 'data', 'regions')
+CRS_CODES = {'EPSG:4326': '4326', 'EPSG:3035': '3035'}
+TABLE_VERSION = 2  # bump when the cached table layout changes
+
+
+def read_boundary(path):
+    """Read a boundary shapefile, falling back to ISO-8859-1 for non-UTF-8 attribute tables."""
+    try:
+        return gpd.read_file(path)
+    except UnicodeDecodeError:
+        return gpd.read_file(path, encoding='ISO-8859-1')
+
+
+def boundary_files(boundaries_dir=DEMO_BOUNDARIES):
+    return sorted(glob.glob(os.path.join(boundaries_dir, '*', '*.shp')))
+
+
+def _source_key(paths, simplify_m):
+    """Hash of the boundary file sets (names, sizes, modification times) and settings."""
+    h = hashlib.sha1(json.dumps({'simplify_m': simplify_m, 'version': TABLE_VERSION}).encode('utf-8'))
+    for shp in paths:
+        for part in sorted(glob.glob(os.path.splitext(shp)[0] + '.*')):
+            st = os.stat(part)
+            h.update(f"{os.path.basename(part)}:{st.st_size}:{int(st.st_mtime)}".encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def build_region_table(paths, simplify_m=250, boundaries_dir=DEMO_BOUNDARIES):
+    """
+    One row per region: region, country, source (shapefile path relative to
+    `boundaries_dir`), area_km2, and for each CRS in CRS_CODES
+    the geometry (`geometry_<code>`), a simplified variant (`simplified_<code>`,
+    tolerance `simplify_m` metres) and bounds (`minx_<code>` ... `maxy_<code>`).
+    """
+    rows = []
+    for path in paths:
+        gdf = read_boundary(path)
+        rows.append({'region': os.path.splitext(os.path.basename(path))[0],
+                     'country': os.path.basename(os.path.dirname(path)),
+                     'source': os.path.relpath(path, boundaries_dir),
+                     'geometry': shapely.make_valid(gdf.to_crs("EPSG:4326").geometry.union_all())})
+    table = gpd.GeoDataFrame(rows, geometry='geometry', crs="EPSG:4326")
+
+    geom_3035 = table.geometry.to_crs("EPSG:3035")
+    simplified_3035 = geom_3035.simplify(simplify_m, preserve_topology=True)
+    table['area_km2'] = geom_3035.area.values / 1e6
+    table = table.rename_geometry('geometry_4326')
+    table['geometry_3035'] = geom_3035
+    table['simplified_3035'] = simplified_3035
+    table['simplified_4326'] = simplified_3035.to_crs("EPSG:4326")
+    for code in CRS_CODES.values():
+        bounds = table[f'geometry_{code}'].bounds
+        for col in ('minx', 'miny', 'maxx', 'maxy'):
+            table[f'{col}_{code}'] = bounds[col].values
+    return table
+
+
+class RegionRegistry:
+    """Access to the cached region table by name, CRS and detail level."""
+
+    def __init__(self, table):
+        self.table = table.set_index('region', drop=False)
+        self._prepared = {}
+
+    @property
+    def names(self):
+        return list(self.table['region'])
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        """Yield {'region', 'country', 'source'} dicts, like the old regions_info lists."""
+        for row in self.table[['region', 'country', 'source']].itertuples(index=False):
+            yield row._asdict()
+
+    def _column(self, crs, simplified):
+        code = CRS_CODES.get(str(crs).upper())
+        if code is None:
+            raise ValueError(f"Regions are cached in {list(CRS_CODES)}, not {crs}")
+        return f"{'simplified' if simplified else 'geometry'}_{code}"
+
+    def geometry(self, name, crs="EPSG:4326", simplified=False):
+        """Dissolved shapely geometry of region `name`."""
+        return self.table.at[name, self._column(crs, simplified)]
+
+    def prepared(self, name, crs="EPSG:4326", simplified=False):
+        """Geometry with shapely's prepared index built (cached in memory)."""
+        key = (name, str(crs).upper(), simplified)
+        if key not in self._prepared:
+            geom = shapely.from_wkb(shapely.to_wkb(self.geometry(name, crs, simplified)))
+            shapely.prepare(geom)
+            self._prepared[key] = geom
+        return self._prepared[key]
+
+    def bounds(self, name, crs="EPSG:4326"):
+        code = CRS_CODES[str(crs).upper()]
+        return tuple(float(self.table.at[name, f'{c}_{code}']) for c in ('minx', 'miny', 'maxx', 'maxy'))
+
+    def frame(self, crs="EPSG:4326", simplified=False, names=None):
+        """GeoDataFrame of (region, country, area_km2, geometry) in `crs`."""
+        column = self._column(crs, simplified)
+        table = self.table if names is None else self.table.loc[list(names)]
+        return gpd.GeoDataFrame({'region': table['region'].values, 'country': table['country'].values,
+                                 'area_km2': table['area_km2'].values},
+                                geometry=gpd.GeoSeries(table[column].values, crs=crs))
+
+    def gdf(self, name, crs="EPSG:4326", simplified=False):
+        """One-row GeoDataFrame of region `name`."""
+        return self.frame(crs, simplified, names=[name])
+
+
+def load_regions(boundaries_dir=DEMO_BOUNDARIES, cache_dir=REGION_CACHE_DIR, simplify_m=250):
+    """Region registry from the GeoParquet cache, rebuilt when the boundary files changed."""
+    paths = boundary_files(boundaries_dir)
+    if not paths:
+        raise FileNotFoundError(f"No <country>/<region>.shp boundaries in {boundaries_dir}")
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"regions_{_source_key(paths, simplify_m)}.parquet")
+    if os.path.exists(cache_path):
+        table = gpd.read_parquet(cache_path)
+    else:
+        table = build_region_table(paths, simplify_m, boundaries_dir)
+        table.to_parquet(cache_path)
+    return RegionRegistry(table)
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'common'))
+from ee_downloads import download_all, download_job, is_transient, local_server
+
+
+@pytest.fixture
+def src_dir(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    for i in range(8):
+        (src / f"region_{i}.tif").write_bytes(os.urandom(50000))
+    return src
+
+
+@pytest.mark.parametrize('message, transient', [
+    ("Too many concurrent aggregations.", True),
+    ("Quota exceeded for quota metric 'Requests' and limit 'Requests per minute'", True),
+    ("Quota exceeded: requests per day limit reached", False),
+    ("Daily quota exhausted for project", False),
+    ("Asset storage quota exceeded", False),
+    ("Image.clip: Parameter 'geometry' is required.", False),
+])
+def test_is_transient_messages(message, transient):
+    assert is_transient(Exception(message)) is transient
+
+
+def test_transient_errors_are_retried(src_dir, tmp_path):
+    with local_server(str(src_dir), fail_first=2) as base_url:
+        stats = download_job(dict(name='r0', url=f"{base_url}/region_0.tif",
+                                  path=str(tmp_path / 'r0.tif')), retries=4, backoff=0.01)
+    assert stats['status'] == 'ok'
+    assert stats['attempts'] == 3
+    assert (tmp_path / 'r0.tif').read_bytes() == (src_dir / 'region_0.tif').read_bytes()
+
+
+def test_retries_exhausted_leave_no_partial_file(src_dir, tmp_path):
+    with local_server(str(src_dir), fail_first=5) as base_url:
+        stats = download_job(dict(name='r0', url=f"{base_url}/region_0.tif",
+                                  path=str(tmp_path / 'r0.tif')), retries=2, backoff=0.01)
+    assert stats['status'] == 'failed'
+    assert stats['attempts'] == 3
+    assert not os.path.exists(tmp_path / 'r0.tif') and not os.path.exists(tmp_path / 'r0.tif.part')
+
+
+def test_rate_quota_backs_off_and_daily_quota_fails_fast(src_dir, tmp_path):
+    calls = {'minute': 0, 'day': 0}
+    with local_server(str(src_dir)) as base_url:
+        def per_minute():
+            calls['minute'] += 1
+            if calls['minute'] == 1:
+                raise Exception("Quota exceeded: export requests per minute")
+            return f"{base_url}/region_0.tif"
+
+        def per_day():
+            calls['day'] += 1
+            raise Exception("Quota exceeded: daily export quota")
+
+        minute = download_job(dict(name='minute', url=per_minute, path=str(tmp_path / 'a.tif')),
+                              retries=3, backoff=0.01)
+        day = download_job(dict(name='day', url=per_day, path=str(tmp_path / 'b.tif')),
+                           retries=3, backoff=0.01)
+    assert minute['status'] == 'ok' and minute['attempts'] == 2
+    assert day['status'] == 'failed' and day['attempts'] == 1 and calls['day'] == 1
+
+
+def test_download_all_runs_jobs_concurrently(src_dir, tmp_path):
+    delay, n_jobs, workers = 0.3, 8, 4
+    with local_server(str(src_dir), delay=delay) as base_url:
+        jobs = [dict(name=f"region_{i}", url=f"{base_url}/region_{i}.tif",
+                     path=str(tmp_path / 'out' / f"region_{i}.tif")) for i in range(n_jobs)]
+        start = time.perf_counter()
+        table = download_all(jobs, max_workers=workers, verbose=False)
+        elapsed = time.perf_counter() - start
+    assert (table['status'] == 'ok').all()
+    assert list(table['name']) == [job['name'] for job in jobs]
+    # 8 jobs of 0.3 s on 4 workers: about 2 rounds, far from the 2.4 s of a serial run
+    assert delay * n_jobs / workers * 0.9 <= elapsed < delay * n_jobs * 0.75
+
+    cached = download_all(jobs, max_workers=workers, verbose=False)
+    assert (cached['status'] == 'cached').all()
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Characterisation_NbS suitabiliity Level 1'))
+from era5_cache import local_fetcher, stored_months, unavailable_path, update_cache
+
+BAND = 'total_precipitation_sum'
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Local stand-in for ERA5-Land: 2000-01 .. 2001-12 on a 4 x 5 grid."""
+    times = pd.date_range('2000-01-01', periods=24, freq='MS')
+    values = np.random.default_rng(0).gamma(2.0, 0.02, (len(times), 4, 5))
+    da = xr.DataArray(values, dims=('time', 'lat', 'lon'), name=BAND,
+                      coords={'time': times, 'lat': np.arange(4.0), 'lon': np.arange(5.0)})
+    path = str(tmp_path / 'source.zarr')
+    da.to_dataset().to_zarr(path, mode='w')
+    return path, da
+
+
+def counting(fetch):
+    """Wrap a fetcher and record the [start, end) ranges it is asked for."""
+    def wrapped(start, end):
+        wrapped.calls.append((start, end))
+        return fetch(start, end)
+    wrapped.calls = []
+    return wrapped
+
+
+def test_initial_build(tmp_path, source):
+    src_path, da = source
+    store = str(tmp_path / 'cache.zarr')
+    added = update_cache(store, local_fetcher(src_path, BAND), BAND, '2000-01-01', '2001-01-01')
+    assert len(added) == 12
+    with xr.open_zarr(store) as ds:
+        np.testing.assert_allclose(ds[BAND].values, da.isel(time=slice(0, 12)).values, rtol=1e-6)
+
+
+def test_monthly_append(tmp_path, source):
+    src_path, da = source
+    store = str(tmp_path / 'cache.zarr')
+    update_cache(store, local_fetcher(src_path, BAND), BAND, '2000-01-01', '2001-01-01')
+    fetch = counting(local_fetcher(src_path, BAND))
+    added = update_cache(store, fetch, BAND, '2000-01-01', '2001-03-01')
+    assert fetch.calls == [(pd.Timestamp('2001-01-01'), pd.Timestamp('2001-03-01'))]
+    assert [t.strftime('%Y-%m') for t in added] == ['2001-01', '2001-02']
+    assert len(stored_months(store)) == 14
+    with xr.open_zarr(store) as ds:
+        np.testing.assert_allclose(ds[BAND].values, da.isel(time=slice(0, 14)).values, rtol=1e-6)
+
+
+def test_backfill(tmp_path, source):
+    src_path, da = source
+    store = str(tmp_path / 'cache.zarr')
+    update_cache(store, local_fetcher(src_path, BAND), BAND, '2000-07-01', '2001-01-01')
+    added = update_cache(store, local_fetcher(src_path, BAND), BAND, '2000-01-01', '2001-01-01')
+    assert len(added) == 6
+    with xr.open_zarr(store) as ds:
+        assert pd.DatetimeIndex(ds['time'].values).is_monotonic_increasing
+        np.testing.assert_allclose(ds[BAND].values, da.isel(time=slice(0, 12)).values, rtol=1e-6)
+
+
+def test_unavailable_months_are_not_requested_again(tmp_path, source):
+    src_path, _ = source
+    store = str(tmp_path / 'cache.zarr')
+    now = pd.Timestamp('2002-02-10')
+    added = update_cache(store, local_fetcher(src_path, BAND), BAND, '2001-01-01', '2002-03-01', now=now)
+    assert len(added) == 12
+    assert os.path.exists(unavailable_path(store))
+
+    fetch = counting(local_fetcher(src_path, BAND))
+    assert update_cache(store, fetch, BAND, '2001-01-01', '2002-03-01', now=now + pd.Timedelta(hours=1)) == []
+    assert fetch.calls == []
+
+    update_cache(store, fetch, BAND, '2001-01-01', '2002-03-01', now=now + pd.Timedelta(days=2))
+    assert fetch.calls == [(pd.Timestamp('2002-01-01'), pd.Timestamp('2002-03-01'))]
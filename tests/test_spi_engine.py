@@ -0,0 +1,75 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Characterisation_NbS suitabiliity Level 1'))
+from spi_engine import compare_with_climate_indices, spi_dataarray, spi_multiscale
+
+CAL_START, CAL_END = 2000, 2029
+
+
+@pytest.fixture(scope='module')
+def precip():
+    times = pd.date_range('2000-01-01', periods=12 * 30, freq='MS')
+    rng = np.random.default_rng(42)
+    values = rng.gamma(2.0, 0.02, (len(times), 6, 10))
+    values[rng.random(values.shape) < 0.05] = 0.0    # dry months
+    values[times.month == 7, :2, :] = 0.0            # July zero in every year (arid rows)
+    values[:, 0, 0] = np.nan                         # no-data pixel
+    values[40:45, 3, 4] = np.nan                     # pixel with a gap in its record
+    return xr.DataArray(values, dims=('time', 'lat', 'lon'), coords={'time': times})
+
+
+@pytest.mark.parametrize('scale', [1, 3, 12])
+def test_spi_matches_climate_indices(precip, scale):
+    pytest.importorskip('climate_indices')
+    da_spi = spi_dataarray(precip, scale, CAL_START, CAL_END)
+    assert compare_with_climate_indices(precip, da_spi, scale, CAL_START, CAL_END, n_pixels=60) < 1e-5
+
+
+@pytest.mark.parametrize('cell', [(1, 5), (3, 4)])
+def test_dry_month_and_gap_match_reference_nan_pattern(precip, cell):
+    pytest.importorskip('climate_indices')
+    from climate_indices import compute, indices
+
+    da_spi = spi_dataarray(precip, 1, CAL_START, CAL_END)
+    values = precip.values[:, cell[0], cell[1]].copy()
+    ref = indices.spi(values, 1, indices.Distribution.gamma, CAL_START, CAL_START, CAL_END,
+                      compute.Periodicity.monthly)
+    spi = da_spi.values[:, cell[0], cell[1]]
+    np.testing.assert_array_equal(np.isnan(spi), np.isnan(ref))
+    np.testing.assert_allclose(spi, ref, atol=1e-5, equal_nan=True)
+
+
+def test_all_zero_month_is_extreme_drought(precip):
+    da_spi = spi_dataarray(precip, 1, CAL_START, CAL_END)
+    july = da_spi.sel(time=da_spi['time.month'] == 7).values[:, :2, 1:]
+    np.testing.assert_allclose(july, -3.09, atol=1e-6)
+
+
+def test_comparator_fails_on_nan_mismatch(precip):
+    pytest.importorskip('climate_indices')
+    da_spi = spi_dataarray(precip, 1, CAL_START, CAL_END)
+    da_spi[:, 1, 5] = np.nan
+    assert np.isinf(compare_with_climate_indices(precip, da_spi, 1, CAL_START, CAL_END, n_pixels=60))
+
+
+def test_parallel_matches_serial(precip):
+    serial = spi_dataarray(precip, 3, CAL_START, CAL_END, n_workers=1)
+    parallel = spi_dataarray(precip, 3, CAL_START, CAL_END, n_workers=2, tile_size=(4, 4))
+    np.testing.assert_allclose(parallel.values, serial.values, atol=1e-6, equal_nan=True)
+    assert np.isnan(serial.values[:, 0, 0]).all()
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_multiscale_matches_single_scale(precip, n_workers):
+    scales = [1, 3, 6, 12]
+    ds = spi_multiscale(precip, scales, CAL_START, CAL_END, n_workers=n_workers, tile_size=(4, 4))
+    for scale in scales:
+        single = spi_dataarray(precip, scale, CAL_START, CAL_END, n_workers=1)
+        np.testing.assert_allclose(ds['spi'].sel(scale=scale).values, single.values,
+                                   atol=1e-6, equal_nan=True)